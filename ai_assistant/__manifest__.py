@@ -4,6 +4,6 @@
     "summary": "Natural language interface for RAG-grounded Odoo execution.",
     "license": "LGPL-3",
     "depends": ["base", "schema_extract", "rag_embedding", "llm_connector", "orm_executor", "web"],
-    "data": ["security/ir.model.access.csv", "data/prompt_template.xml"],
+    "data": ["security/ir.model.access.csv", "data/chat_rules.xml", "data/prompt_template.xml"],
     "installable": True,
 }
@@ -0,0 +1,299 @@
+"""Benchmark harness for the AskOdoo pipeline against a synthetic corpus.
+
+Everything runs in one transaction that the caller rolls back, vector
+index files go to a temporary directory, and LLM traffic goes to a local
+stand-in for Ollama with a configurable latency, so runs are repeatable and
+leave the database and the served index untouched.
+"""
+
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_PREFIX = 'x_askodoo_bench'
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Serves /api/embed, /api/embeddings and /api/generate after ``server.latency`` seconds."""
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(self.server.latency)
+        if self.path == '/api/embed':
+            body = {'embeddings': [self.server.embed(text) for text in payload['input']]}
+        elif self.path == '/api/embeddings':
+            body = {'embedding': self.server.embed(payload['prompt'])}
+        elif self.path == '/api/generate':
+            body = {'response': self.server.completion, 'done': True}
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, dimension=768):
+        super().__init__(('127.0.0.1', 0), FakeOllamaHandler)
+        self.latency = latency
+        self.dimension = dimension
+        self.completion = '{"tool": "respond", "args": {"message": "benchmark"}}'
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%s' % self.server_address[1]
+
+    def embed(self, text):
+        rng = random.Random(text)
+        return [rng.uniform(-1.0, 1.0) for _index in range(self.dimension)]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+def percentile(samples, rank):
+    """Nearest-rank percentile of ``samples``."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, math.ceil(rank / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def current_rss_kb():
+    """Resident set size of the process right now, or None where ``/proc`` is unavailable.
+
+    Unlike ``ru_maxrss``, which only ever grows, it tells what one stage
+    added.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+class Recorder:
+    """Collects wall-clock samples and resident memory growth per stage."""
+
+    def __init__(self):
+        self.samples = {}
+        self.rss_deltas = {}
+
+    def measure(self, stage, func, *args, **kwargs):
+        rss_before = current_rss_kb()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.samples.setdefault(stage, []).append((time.perf_counter() - start) * 1000.0)
+        rss_after = current_rss_kb()
+        if rss_before is not None and rss_after is not None:
+            self.rss_deltas.setdefault(stage, []).append(rss_after - rss_before)
+        return result
+
+    def repeat(self, stage, iterations, func, *args, **kwargs):
+        for _index in range(iterations):
+            self.measure(stage, func, *args, **kwargs)
+
+    def summary(self):
+        return {
+            stage: {
+                'runs': len(samples),
+                'p50_ms': round(percentile(samples, 50), 3),
+                'p95_ms': round(percentile(samples, 95), 3),
+                'p99_ms': round(percentile(samples, 99), 3),
+                'mean_ms': round(sum(samples) / len(samples), 3),
+                'max_ms': round(max(samples), 3),
+                'rss_delta_kb': sum(self.rss_deltas[stage]) if stage in self.rss_deltas else None,
+                'max_rss_delta_kb': max(self.rss_deltas[stage]) if stage in self.rss_deltas else None,
+            }
+            for stage, samples in self.samples.items()
+        }
+
+
+@contextmanager
+def isolated_index_directory(db_name):
+    """Write the memory-mapped index generations of the run to a temporary directory.
+
+    Rolling back does not undo file writes: building into the shared
+    directory would prune the generation the workers are serving.
+    """
+    from odoo.addons.rag_embedding.models import vector_index
+
+    directory = tempfile.mkdtemp(prefix='askodoo-bench-')
+    original = vector_index.index_directory
+    vector_index.index_directory = lambda dbname: directory
+    try:
+        yield directory
+    finally:
+        vector_index.index_directory = original
+        with vector_index._lock:
+            vector_index._loaded.pop(db_name, None)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def generate_corpus(env, documents, fields_per_model=20, methods_per_model=5):
+    """Create synthetic schema models and methods yielding about ``documents`` RAG documents.
+
+    Every model produces a summary document, its field group documents and
+    one document per method.
+    """
+    per_chunk = int(env['ir.config_parameter'].sudo().get_param('askodoo.rag.fields_per_chunk', 25))
+    docs_per_model = 1 + -(-fields_per_model // max(1, per_chunk)) + methods_per_model
+    model_count = max(1, documents // docs_per_model)
+    methods = env['askodoo.schema.method'].create([
+        {
+            'owner_class': f'odoo.addons.{BENCH_PREFIX}.models.Model{index}',
+            'owner_model': f'{BENCH_PREFIX}.model{index}',
+            'name': f'action_step{method}',
+            'signature': '(self)',
+            'docstring': f'Run step {method} of synthetic benchmark model {index}.',
+            'is_public': True,
+        }
+        for index in range(model_count)
+        for method in range(methods_per_model)
+    ])
+    field_types = ['char', 'integer', 'many2one', 'boolean', 'date', 'float']
+    env['askodoo.schema.model'].create([
+        {
+            'model_name': f'{BENCH_PREFIX}.model{index}',
+            'description': f'Synthetic Model {index}',
+            'field_count': fields_per_model,
+            'fields_json': json.dumps({
+                f'x_field{field}': {
+                    'type': field_types[field % len(field_types)],
+                    'string': f'Field {field}',
+                    'required': field % 7 == 0,
+                    'readonly': False,
+                    'store': True,
+                    'relation': 'res.partner' if field % len(field_types) == 2 else False,
+                }
+                for field in range(fields_per_model)
+            }),
+            'method_ids': [(6, 0, methods[index * methods_per_model:(index + 1) * methods_per_model].ids)],
+        }
+        for index in range(model_count)
+    ])
+    return model_count
+
+
+def run_benchmark(env, documents=1000, latency_ms=0.0, iterations=50, dimension=768,
+                  fields_per_model=20, methods_per_model=5):
+    """Benchmark every pipeline stage in ``env`` and return the results as a dict."""
+    recorder = Recorder()
+    rng = random.Random(0)
+    params = env['ir.config_parameter'].sudo()
+    with FakeOllamaServer(latency=latency_ms / 1000.0, dimension=dimension) as server, \
+            isolated_index_directory(env.cr.dbname):
+        env['askodoo.llm.connector'].search([]).write({'is_default': False})
+        env['askodoo.llm.connector'].create({
+            'name': 'Benchmark stand-in',
+            'provider': 'ollama',
+            'base_url': server.base_url,
+            'is_default': True,
+            'pool_name': BENCH_PREFIX,
+            'retry_backoff': 0.0,
+        })
+        params.set_param('askodoo.llm.embedding_pool', BENCH_PREFIX)
+        params.set_param('askodoo.llm.completion_pool', BENCH_PREFIX)
+        params.set_param('askodoo.rag.vector_dimension', dimension)
+        params.set_param('askodoo.embedding_cache.enabled', 'False')
+        params.set_param('askodoo.answer_cache.enabled', 'False')
+
+        schema = env['askodoo.schema.model']
+        recorder.measure('extract_all_models', schema.extract_all_models)
+        recorder.repeat('extract_all_models_unchanged', 3, schema.extract_all_models)
+        model_count = recorder.measure(
+            'generate_corpus', generate_corpus, env, documents, fields_per_model, methods_per_model
+        )
+        documents_model = env['askodoo.rag.document']
+        build_stats = recorder.measure('build_schema_embeddings', documents_model.build_schema_embeddings)
+        recorder.measure('build_schema_embeddings_unchanged', documents_model.build_schema_embeddings)
+
+        queries = [
+            f'Run step {rng.randrange(methods_per_model)} on synthetic model {rng.randrange(model_count)}'
+            for _index in range(iterations)
+        ]
+        connector = env['askodoo.llm.connector'].get_connector('embedding')
+        vectors = [connector.embed_text(query) for query in queries]
+        for query, vector in zip(queries, vectors):
+            recorder.measure(
+                'semantic_search', documents_model.semantic_search, query, top_k=6, query_vector=vector
+            )
+
+        executor = env['askodoo.orm.executor']
+        pairs = [
+            (f'{BENCH_PREFIX}.model{rng.randrange(model_count)}', f'action_step{rng.randrange(methods_per_model)}')
+            for _index in range(iterations)
+        ] + [('res.partner', 'write'), ('res.partner', 'action_unknown')]
+        for model_name, method in pairs:
+            recorder.measure('is_allowed', executor._is_allowed, model_name, method)
+
+        partner = env['res.partner'].create({'name': 'AskOdoo Benchmark'})
+        payload = {
+            'tool': 'orm_call',
+            'args': {
+                'model': 'res.partner',
+                'method': 'write',
+                'domain': [['id', '=', partner.id]],
+                'values': {'comment': 'benchmark'},
+            },
+        }
+        recorder.repeat('execute_tool_call', iterations, executor.execute_tool_call, payload)
+
+        server.completion = json.dumps(payload)
+        session = env['askodoo.chat.session']
+        for query in queries:
+            recorder.measure('ask', session.ask_once, query)
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'database': env.cr.dbname,
+            'documents': env['askodoo.rag.document'].search_count([]),
+            'synthetic_models': model_count,
+            'latency_ms': latency_ms,
+            'iterations': iterations,
+            'dimension': dimension,
+            'retrieval_mode': params.get_param('askodoo.rag.retrieval_mode', 'auto'),
+            'build_stats': build_stats,
+        },
+        'stages': recorder.summary(),
+    }
+
+
+def compare(results, baseline):
+    """Return the p50/p95 ratio of ``results`` over ``baseline`` for every shared stage."""
+    ratios = {}
+    for stage, current in results['stages'].items():
+        previous = baseline.get('stages', {}).get(stage)
+        if not previous:
+            continue
+        ratios[stage] = {
+            key: round(current[key] / previous[key], 3) if previous[key] else None
+            for key in ('p50_ms', 'p95_ms')
+        }
+    return ratios
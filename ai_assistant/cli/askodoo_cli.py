@@ -1,27 +1,177 @@
 """CLI for AskOdoo workflow automation."""
 
 import argparse
+import functools
+import json
+import multiprocessing
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-from odoo import api
-from odoo.modules.registry import Registry
+import askodoo_bench
+import askodoo_daemon
 
 
+@contextmanager
 def _with_env(db_name, uid=1):
-    registry = Registry(db_name)
-    with registry.cursor() as cr:
+    """Yield an environment on a new cursor, committed and signalled on a normal exit."""
+    # Odoo is imported here so that thin clients of the daemon never load it.
+    from odoo import api
+    from odoo.modules.registry import Registry
+
+    # A long-lived daemon must pick up registry and cache changes made by other processes.
+    registry = Registry(db_name).check_signaling()
+    with registry.manage_changes(), registry.cursor() as cr:
         env = api.Environment(cr, uid, {})
         yield env
 
 
-def build_embeddings(db_name):
-    for env in _with_env(db_name):
+def build_embeddings(db_name, workers=1, shard_size=50, restart=False, emit=print, threads=False):
+    """Run a sharded embedding build, resuming the last unfinished job unless ``restart``."""
+    with _with_env(db_name) as env:
         env['askodoo.schema.model'].extract_all_models()
-        env['askodoo.rag.document'].build_schema_embeddings()
+        jobs = env['askodoo.embedding.job']
+        job = jobs.browse() if restart else jobs.get_resumable_job()
+        if job:
+            emit(f'Resuming embedding job {job.id} ({job.done_count}/{job.shard_count} shards done)')
+        else:
+            job = jobs.create_build_job(shard_size=shard_size, worker_count=workers)
+        job.prepare_run()
+        job_id = job.id
+        env.cr.commit()
+    _run_embedding_workers(db_name, job_id, workers, threads=threads)
+    with _with_env(db_name) as env:
+        stats = env['askodoo.embedding.job'].browse(job_id).finalize()
+        env.cr.commit()
+        return stats
+
+
+def _embedding_worker(db_name, job_id):
+    with _with_env(db_name) as env:
+        return env['askodoo.embedding.job'].browse(job_id).process_shards()
+
+
+def _run_embedding_workers(db_name, job_id, workers, threads=False):
+    if workers <= 1:
+        return _embedding_worker(db_name, job_id)
+    if threads:
+        # The daemon keeps serving other clients from its connection pool, so it cannot fork.
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='askodoo-build') as pool:
+            return sum(pool.map(lambda _index: _embedding_worker(db_name, job_id), range(workers)))
+    from odoo import sql_db
+
+    # Forked workers open their own connections; never share the parent's.
+    sql_db.close_all()
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        return sum(pool.starmap(_embedding_worker, [(db_name, job_id)] * workers))
+
+
+def embedding_status(db_name):
+    with _with_env(db_name) as env:
+        job = env['askodoo.embedding.job'].search([], limit=1)
+        return job.get_status() if job else None
+
+
+def storage_report(db_name, sample_size=500):
+    with _with_env(db_name) as env:
+        return env['askodoo.rag.document'].vector_storage_report(sample_size=sample_size)
+
+
+def convert_storage(db_name, mode=None):
+    with _with_env(db_name) as env:
+        converted = env['askodoo.rag.document'].convert_vector_storage(mode=mode)
+        env.cr.commit()
+        return converted
+
+
+def run_bench(db_name, **options):
+    """Run the benchmark in a transaction that is always rolled back."""
+    with _with_env(db_name) as env:
+        try:
+            return askodoo_bench.run_benchmark(env, **options)
+        finally:
+            env.cr.rollback()
+
+
+def ask_query(db_name, query, emit=print):
+    with _with_env(db_name) as env:
+        return env['askodoo.chat.session'].ask_once(query)
+
 
+def ask_queries(db_name, queries, emit=print):
+    """Answer ``queries`` as one batch, emitting a JSON line per answer in order."""
+    with _with_env(db_name) as env:
+        for item in env['askodoo.chat.session'].ask_batch(queries):
+            emit(json.dumps(item, default=str))
 
-def ask_query(db_name, query):
-    for env in _with_env(db_name):
-        return env['askodoo.chat.session'].ask(query)
+
+def warm_up(db_name):
+    """Load what the first request would otherwise pay for: the vector index, HTTP sessions and allowlist."""
+    from odoo.addons.llm_connector.models import http_pool
+    from odoo.addons.rag_embedding.models import vector_index
+
+    with _with_env(db_name) as env:
+        vector_index.load_index(db_name, env['askodoo.rag.document']._get_index_generation())
+        for purpose in ('embedding', 'completion'):
+            connector = env['askodoo.llm.connector'].get_connector(purpose)
+            if connector:
+                settings = connector._request_settings()
+                http_pool.get_session(settings['key'], settings['pool_size'])
+        env['askodoo.orm.executor']._get_allowlist_index()
+
+
+# Commands that run in the daemon when one is listening.
+COMMANDS = {
+    'build-embeddings': build_embeddings,
+    'query': ask_query,
+    'query-file': ask_queries,
+}
+
+
+def serve(db_name, socket_path):
+    """Keep a warm registry and answer CLI commands on ``socket_path`` until interrupted."""
+    warm_up(db_name)
+    commands = dict(COMMANDS, **{'build-embeddings': functools.partial(build_embeddings, threads=True)})
+    daemon = askodoo_daemon.AskOdooDaemon(socket_path, db_name, commands)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f'AskOdoo daemon for {db_name} listening on {socket_path}', flush=True)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.server_close()
+
+
+def run_command(args, command, **options):
+    """Run ``command`` in the daemon serving ``args.db`` when one listens, in-process otherwise."""
+    if not args.no_daemon:
+        socket_path = args.socket or askodoo_daemon.default_socket_path(args.db)
+        try:
+            replies = askodoo_daemon.call(socket_path, args.db, command, options)
+        except askodoo_daemon.DaemonUnavailable:
+            pass
+        else:
+            for event, data in replies:
+                if event == 'output':
+                    print(data, flush=True)
+                elif event == 'error':
+                    raise SystemExit(f'AskOdoo daemon error: {data}')
+                elif event == 'result':
+                    return data
+            raise SystemExit('AskOdoo daemon closed the connection without a result')
+    return COMMANDS[command](args.db, emit=_print_line, **options)
+
+
+def _print_line(line):
+    print(line, flush=True)
+
+
+def _add_daemon_options(parser):
+    parser.add_argument(
+        '--socket', help='Daemon socket, defaults to askodoo-<uid>/<db>.sock in the runtime directory'
+    )
+    parser.add_argument('--no-daemon', action='store_true', help='Run in this process even when a daemon listens')
 
 
 def main():
@@ -30,17 +180,83 @@ def main():
 
     cmd_embed = sub.add_parser('build-embeddings')
     cmd_embed.add_argument('--db', required=True)
+    cmd_embed.add_argument('--workers', type=int, default=1, help='Worker processes embedding shards in parallel')
+    cmd_embed.add_argument('--shard-size', type=int, default=50, help='Schema models per shard')
+    cmd_embed.add_argument('--restart', action='store_true', help='Start a new job instead of resuming')
+    _add_daemon_options(cmd_embed)
+
+    cmd_status = sub.add_parser('status')
+    cmd_status.add_argument('--db', required=True)
+
+    cmd_report = sub.add_parser('storage-report')
+    cmd_report.add_argument('--db', required=True)
+    cmd_report.add_argument('--sample', type=int, default=500, help='Stored vectors sampled for the comparison')
+
+    cmd_convert = sub.add_parser('convert-storage')
+    cmd_convert.add_argument('--db', required=True)
+    cmd_convert.add_argument(
+        '--mode', choices=['float32', 'int8', 'json'], help='Defaults to askodoo.rag.vector_storage'
+    )
+
+    cmd_bench = sub.add_parser('bench')
+    cmd_bench.add_argument('--db', required=True)
+    cmd_bench.add_argument('--documents', type=int, default=1000, help='Approximate synthetic RAG documents')
+    cmd_bench.add_argument('--fields-per-model', type=int, default=20)
+    cmd_bench.add_argument('--methods-per-model', type=int, default=5)
+    cmd_bench.add_argument('--latency-ms', type=float, default=0.0, help='Latency of the fake Ollama server')
+    cmd_bench.add_argument('--dimension', type=int, default=768, help='Embedding size of the fake Ollama server')
+    cmd_bench.add_argument('--iterations', type=int, default=50, help='Samples per measured operation')
+    cmd_bench.add_argument('--output', help='Write the results as JSON to this file')
+    cmd_bench.add_argument('--baseline', help='Earlier results JSON to compare p50/p95 against')
 
     cmd_query = sub.add_parser('query')
     cmd_query.add_argument('--db', required=True)
-    cmd_query.add_argument('--text', required=True)
+    query_source = cmd_query.add_mutually_exclusive_group(required=True)
+    query_source.add_argument('--text')
+    query_source.add_argument('--file', help='Answer one query per line as a batch, printing JSON lines')
+    _add_daemon_options(cmd_query)
+
+    cmd_serve = sub.add_parser('serve')
+    cmd_serve.add_argument('--db', required=True)
+    cmd_serve.add_argument('--socket', help='Defaults to askodoo-<uid>/<db>.sock in the runtime directory')
 
     args = parser.parse_args()
     if args.command == 'build-embeddings':
-        build_embeddings(args.db)
-        print('Embeddings updated')
+        stats = run_command(
+            args, 'build-embeddings', workers=args.workers, shard_size=args.shard_size, restart=args.restart
+        )
+        print('Embeddings updated' if stats is not False else 'Embedding job has failed shards; rerun to resume')
+    elif args.command == 'status':
+        print(json.dumps(embedding_status(args.db), indent=2))
+    elif args.command == 'storage-report':
+        print(json.dumps(storage_report(args.db, sample_size=args.sample), indent=2))
+    elif args.command == 'convert-storage':
+        print(f'{convert_storage(args.db, mode=args.mode)} embeddings converted')
+    elif args.command == 'bench':
+        results = run_bench(
+            args.db,
+            documents=args.documents,
+            latency_ms=args.latency_ms,
+            iterations=args.iterations,
+            dimension=args.dimension,
+            fields_per_model=args.fields_per_model,
+            methods_per_model=args.methods_per_model,
+        )
+        if args.baseline:
+            with open(args.baseline) as baseline_file:
+                results['comparison'] = askodoo_bench.compare(results, json.load(baseline_file))
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+        print(json.dumps(results, indent=2))
+    elif args.command == 'query' and args.file:
+        # The file is read here: the daemon may not share this working directory.
+        with open(args.file) as query_file:
+            run_command(args, 'query-file', queries=[line.strip() for line in query_file if line.strip()])
     elif args.command == 'query':
-        print(ask_query(args.db, args.text))
+        print(run_command(args, 'query', query=args.text))
+    elif args.command == 'serve':
+        serve(args.db, args.socket or askodoo_daemon.default_socket_path(args.db))
 
 
 if __name__ == '__main__':
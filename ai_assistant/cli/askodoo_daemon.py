@@ -0,0 +1,158 @@
+"""Unix socket daemon keeping a warm AskOdoo process for the CLI.
+
+``serve`` loads the registry once and answers CLI commands sent over a
+local socket, so each invocation skips the registry startup. Requests and
+replies are JSON lines: the client sends ``{"db", "command", "args"}`` and
+receives ``output`` events for printed lines, then one ``result`` or
+``error`` event.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import struct
+import tempfile
+
+_logger = logging.getLogger(__name__)
+
+
+class DaemonUnavailable(Exception):
+    """Raised when no daemon of the current user listens on the socket."""
+
+
+def default_socket_path(db_name):
+    return os.path.join(socket_directory(), f'{db_name}.sock')
+
+
+def socket_directory():
+    """Return the current user's private socket directory, creating it when missing.
+
+    Falls back from ``$XDG_RUNTIME_DIR`` to the shared temp directory, where
+    another user could have created the directory first: it is only used
+    when it belongs to the current user and nobody else can enter it.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    directory = os.path.join(runtime_dir, f'askodoo-{os.getuid()}')
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f'{directory} must be a directory private to the current user')
+    return directory
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # A liveness probe that connected and hung up.
+            return
+        request = json.loads(line)
+        command = self.server.commands.get(request.get('command'))
+        try:
+            if request.get('db') != self.server.db_name:
+                raise ValueError(f'This daemon serves database {self.server.db_name!r}')
+            if command is None:
+                raise ValueError(f'Unknown command {request.get("command")!r}')
+            result = command(
+                self.server.db_name, emit=lambda text: self.send('output', text), **request.get('args', {})
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            _logger.exception('AskOdoo daemon command %r failed', request.get('command'))
+            self.send('error', str(error))
+            return
+        self.send('result', result)
+
+    def send(self, event, data):
+        self.wfile.write((json.dumps({'event': event, 'data': data}, default=str) + '\n').encode())
+        self.wfile.flush()
+
+
+class AskOdooDaemon(socketserver.ThreadingUnixStreamServer):
+    """Serves ``commands`` for ``db_name``, one thread and one cursor per connection."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, db_name, commands):
+        _claim_socket(socket_path)
+        # The daemon acts as the superuser: only its owner may connect.
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, DaemonHandler)
+        finally:
+            os.umask(umask)
+        self.socket_path = socket_path
+        self.db_name = db_name
+        self.commands = commands
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+def _claim_socket(socket_path):
+    """Remove a stale socket file, refusing to replace a live daemon."""
+    try:
+        owner = os.lstat(socket_path).st_uid
+    except FileNotFoundError:
+        return
+    if owner != os.getuid():
+        raise RuntimeError(f'{socket_path} belongs to another user')
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.unlink(socket_path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f'An AskOdoo daemon already listens on {socket_path}')
+
+
+def call(socket_path, db_name, command, args):
+    """Send ``command`` to the daemon and return an iterator of its ``(event, data)`` replies.
+
+    Raises ``DaemonUnavailable`` right away when nothing listens on
+    ``socket_path``, so callers can fall back to running in-process. A
+    listener run by another user gets nothing sent to it and counts as
+    unavailable too.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        owner = _peer_uid(sock, socket_path)
+    except OSError as error:
+        sock.close()
+        raise DaemonUnavailable(str(error)) from error
+    if owner != os.getuid():
+        sock.close()
+        _logger.warning('Ignoring %s: it is served by uid %s, not the current user', socket_path, owner)
+        raise DaemonUnavailable(f'{socket_path} is served by another user')
+    return _replies(sock, {'db': db_name, 'command': command, 'args': args})
+
+
+def _peer_uid(sock, socket_path):
+    """Return the uid of the process listening on ``sock``."""
+    if hasattr(socket, 'SO_PEERCRED'):
+        credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        return struct.unpack('3i', credentials)[1]
+    # Without peer credentials, trust the owner of the socket file.
+    return os.stat(socket_path).st_uid
+
+
+def _replies(sock, request):
+    with sock, sock.makefile('rwb') as stream:
+        stream.write((json.dumps(request) + '\n').encode())
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            yield message['event'], message['data']
@@ -1,11 +1,91 @@
-"""HTTP controller exposing AskOdoo query endpoint."""
+"""HTTP controller exposing AskOdoo query endpoints."""
+
+import hmac
+import json
 
 from odoo import http
 from odoo.http import request
 
+from odoo.addons.llm_connector.models import timing
+
 
 class AskOdooController(http.Controller):
 
     @http.route('/askodoo/query', type='json', auth='user')
-    def askodoo_query(self, query):
-        return request.env['askodoo.chat.session'].sudo().ask(query)
+    def askodoo_query(self, query, session_id=None):
+        """Answer ``query``; with ``session_id`` as the next turn of that conversation."""
+        sessions = request.env['askodoo.chat.session'].sudo()
+        if not session_id:
+            return sessions.ask_once(query)
+        session = sessions.search([('id', '=', int(session_id)), ('user_id', '=', request.env.uid)])
+        if not session:
+            return {'error': 'Unknown session'}
+        return session.ask(query)
+
+    @http.route('/askodoo/session', type='json', auth='user')
+    def askodoo_session(self, name=None):
+        """Start a conversation and return its ``session_id``."""
+        values = {'user_id': request.env.uid}
+        if name:
+            values['name'] = name
+        return {'session_id': request.env['askodoo.chat.session'].sudo().create(values).id}
+
+    @http.route('/askodoo/query/stream', type='http', auth='user', methods=['POST'], csrf=False)
+    def askodoo_query_stream(self, **kwargs):
+        """Server-sent events for ``{"query": ...}``: ``token`` fragments as generated, then one ``result``.
+
+        Like the batch endpoint, only a JSON body is accepted: browsers cannot
+        send one cross-site without a CORS preflight, which stands in for the
+        CSRF token this route cannot check.
+        """
+        query = (request.httprequest.get_json(silent=True) or {}).get('query')
+        if not isinstance(query, str) or not query:
+            return request.make_json_response({'error': 'Missing query'}, status=400)
+        events = request.env['askodoo.chat.session'].sudo().ask_stream(query)
+        return request.make_response(self._sse(events), headers=[
+            ('Content-Type', 'text/event-stream'),
+            ('Cache-Control', 'no-cache'),
+            ('X-Accel-Buffering', 'no'),
+        ])
+
+    @http.route('/askodoo/query/batch', type='http', auth='user', methods=['POST'], csrf=False)
+    def askodoo_query_batch(self, **kwargs):
+        """Answer ``{"queries": [...]}`` as newline-delimited JSON, one line per query in order."""
+        queries = (request.httprequest.get_json(silent=True) or {}).get('queries')
+        if not isinstance(queries, list) or not all(isinstance(query, str) and query for query in queries):
+            return request.make_json_response({'error': 'Expected a list of query strings'}, status=400)
+        limit = int(request.env['ir.config_parameter'].sudo().get_param('askodoo.batch.max_queries', 500))
+        if len(queries) > limit:
+            return request.make_json_response({'error': f'At most {limit} queries per batch'}, status=413)
+        items = request.env['askodoo.chat.session'].sudo().ask_batch(queries)
+        return request.make_response(self._ndjson(items), headers=[
+            ('Content-Type', 'application/x-ndjson'),
+            ('Cache-Control', 'no-cache'),
+            ('X-Accel-Buffering', 'no'),
+        ])
+
+    @http.route('/askodoo/metrics', type='http', auth='none', methods=['GET'], csrf=False)
+    def askodoo_metrics(self, **kwargs):
+        """Prometheus text metrics merged across the workers of this host.
+
+        Disabled until ``askodoo.metrics.token`` is set, then only served to
+        requests bearing that token.
+        """
+        token = request.db and request.env['ir.config_parameter'].sudo().get_param('askodoo.metrics.token')
+        if not token:
+            return request.make_response('Metrics are disabled', status=403)
+        if not hmac.compare_digest(request.httprequest.headers.get('Authorization', ''), f'Bearer {token}'):
+            return request.make_response('Unauthorized', status=401)
+        return request.make_response(timing.render_prometheus(), headers=[
+            ('Content-Type', 'text/plain; version=0.0.4'),
+        ])
+
+    @staticmethod
+    def _ndjson(items):
+        for item in items:
+            yield (json.dumps(item, default=str) + '\n').encode()
+
+    @staticmethod
+    def _sse(events):
+        for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
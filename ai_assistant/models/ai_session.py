@@ -2,7 +2,40 @@
 
 from __future__ import annotations
 
+import hashlib
+import json
+import logging
+import re
+import textwrap
+
 from odoo import api, fields, models
+from odoo.tools import str2bool
+
+from odoo.addons.llm_connector.models import timing
+
+from .answer_cache import answer_cache
+
+_logger = logging.getLogger(__name__)
+
+# Methods whose planned payload may be served from the answer cache.
+ANSWER_CACHE_READ_METHODS = frozenset({"read", "search_read", "search_count", "name_get", "read_group"})
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Characters of a tool call result kept on its turn for follow-up questions.
+TURN_RESULT_CHARS = 2000
+
+
+def estimate_tokens(text):
+    """Cheap local token estimate: words count once, longer words and punctuation add up.
+
+    Close enough to BPE tokenizers for budgeting without loading one.
+    """
+    return sum(1 + len(token) // 8 for token in _TOKEN_PATTERN.findall(text or ""))
+
+
+def _chunk_digest(content):
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
 
 
 class AskOdooPromptTemplate(models.Model):
@@ -14,6 +47,18 @@ class AskOdooPromptTemplate(models.Model):
     active = fields.Boolean(default=True)
 
 
+class AskOdooChatTurn(models.Model):
+    _name = "askodoo.chat.turn"
+    _description = "AskOdoo Chat Turn"
+    _order = "id"
+
+    session_id = fields.Many2one("askodoo.chat.session", required=True, ondelete="cascade", index=True)
+    query = fields.Text(required=True)
+    answer = fields.Text()
+    result = fields.Text(help="Result of the executed tool call, as truncated JSON.")
+    summarized = fields.Boolean(default=False, help="Folded into the session summary and left out of prompts.")
+
+
 class AskOdooChatSession(models.Model):
     _name = "askodoo.chat.session"
     _description = "AskOdoo Chat Session"
@@ -21,27 +66,364 @@ class AskOdooChatSession(models.Model):
     name = fields.Char(required=True, default="AskOdoo Session")
     user_id = fields.Many2one("res.users", required=True, default=lambda self: self.env.user)
     history = fields.Text(default="")
+    turn_ids = fields.One2many("askodoo.chat.turn", "session_id")
+    summary = fields.Text(help="Condensed turns that left the history window.")
+    llm_context = fields.Text(copy=False, prefetch=False, help="Provider context of the conversation, as JSON.")
+    llm_context_model = fields.Char(copy=False)
+    llm_context_chunks = fields.Text(copy=False, prefetch=False, help="Digests of the grounding in the context.")
 
-    @api.model
     def ask(self, user_query):
-        rag_docs = self.env["askodoo.rag.document"].semantic_search(user_query, top_k=6)
-        connector = self.env["askodoo.llm.connector"].get_default_connector()
-        prompt = self._build_prompt(user_query, rag_docs)
+        """Answer ``user_query`` as the next turn of this conversation.
+
+        Earlier turns ground the prompt and the turn is stored.
+        """
+        self.ensure_one()
+        return self._timed_ask(user_query)
+
+    @api.model
+    def ask_once(self, user_query):
+        """Answer ``user_query`` on its own, outside any conversation."""
+        return self.browse()._timed_ask(user_query)
+
+    def _timed_ask(self, user_query):
+        """Answer ``user_query``, reporting per-stage timings when enabled."""
+        settings = self._timing_settings()
+        if not settings["enabled"]:
+            return self._ask(user_query)
+        with timing.collect() as timings:
+            answer = self._ask(user_query)
+        answer["timings"] = timings.as_dict()
+        timing.count("queries")
+        if settings["slow_query_ms"] and answer["timings"]["total"] >= settings["slow_query_ms"]:
+            timing.count("slow_queries")
+            _logger.warning("AskOdoo slow query (%s): %r", answer["timings"], user_query[:200])
+        return answer
+
+    @api.model
+    def _timing_settings(self):
+        params = self.env["ir.config_parameter"].sudo()
+        return {
+            "enabled": str2bool(params.get_param("askodoo.timing.enabled", "True")),
+            "slow_query_ms": float(params.get_param("askodoo.timing.slow_query_ms", 5000)),
+        }
+
+    def _ask(self, user_query):
+        """Answer ``user_query`` as the next turn of ``self``, or on its own when ``self`` is empty."""
+        connectors = self.env["askodoo.llm.connector"]
+        query_vector = connectors.get_connector("embedding").embed_text(user_query)
+        cache_settings = self._answer_cache_settings()
+        # Follow-up questions depend on earlier turns, so conversations bypass the cache.
+        cache_settings["enabled"] = cache_settings["enabled"] and len(self) != 1
+        if cache_settings["enabled"]:
+            with timing.span("answer_cache"):
+                cached_payload = answer_cache.lookup(
+                    self.env.cr.dbname,
+                    cache_settings["generation"],
+                    query_vector,
+                    cache_settings["threshold"],
+                    cache_settings["ttl"],
+                )
+            if cached_payload:
+                return dict(self._answer_from_payload(cached_payload, ""), cached=True)
+        with timing.span("search"):
+            rag_docs = self.env["askodoo.rag.document"].semantic_search(
+                user_query, top_k=self._prompt_settings()["candidates"], query_vector=query_vector
+            )
+        if len(self) == 1:
+            return self._ask_turn(user_query, rag_docs)
+        with timing.span("prompt"):
+            prompt, prompt_info = self._build_prompt(user_query, rag_docs)
+        connector = connectors.get_connector("completion")
         raw_output = connector.complete_text(prompt)
-        tool_payload = connector.parse_tool_call(raw_output)
+        with timing.span("parse"):
+            tool_payload = connector.parse_tool_call(raw_output)
+        if cache_settings["enabled"] and self._is_cacheable_payload(tool_payload):
+            answer_cache.put(
+                self.env.cr.dbname,
+                cache_settings["generation"],
+                user_query,
+                query_vector,
+                tool_payload,
+                cache_settings["size"],
+            )
+        return dict(self._answer_from_payload(tool_payload, raw_output), prompt=prompt_info)
+
+    def _ask_turn(self, user_query, rag_docs):
+        """Answer ``user_query`` as the next turn of this conversation and store the turn.
+
+        While the Ollama context of the previous turn is reusable, the prompt
+        only holds the query and grounding not sent yet; the template,
+        earlier grounding and earlier turns are already in the context.
+        Otherwise a full prompt is built with the summary and the recent
+        turns, and a new context starts.
+        """
+        self.ensure_one()
+        settings = self._conversation_settings()
+        connector = self.env["askodoo.llm.connector"].get_connector("completion")
+        context_model = f"{connector.provider}:{connector.model_name}"
+        with timing.span("prompt"):
+            context = self._reusable_context(context_model, settings)
+            sent = set(json.loads(self.llm_context_chunks or "[]")) if context else set()
+            if context:
+                # The context holds the previous tool call but not what it returned.
+                previous = self.turn_ids[-1:].result
+                prompt, prompt_info = self._build_followup_prompt(user_query, rag_docs, sent, previous)
+            else:
+                prompt, prompt_info = self._build_prompt(user_query, rag_docs, self._history_text(), sent)
+            prompt_info["reused_tokens"] = len(context or [])
+        raw_output, context = connector.complete_turn(prompt, context)
+        with timing.span("parse"):
+            tool_payload = connector.parse_tool_call(raw_output)
+        answer = dict(self._answer_from_payload(tool_payload, raw_output), prompt=prompt_info)
+        self.env["askodoo.chat.turn"].create(dict(self._turn_values(answer), session_id=self.id, query=user_query))
+        self.write({
+            "llm_context": json.dumps(context) if context else False,
+            "llm_context_model": context_model if context else False,
+            "llm_context_chunks": json.dumps(sorted(sent)) if context else False,
+        })
+        self._fold_turns(settings)
+        return answer
+
+    @api.model
+    def _conversation_settings(self):
+        params = self.env["ir.config_parameter"].sudo()
+        return {
+            "window": int(params.get_param("askodoo.chat.window", 4)),
+            "summary_tokens": int(params.get_param("askodoo.chat.summary_tokens", 300)),
+            "context_tokens": int(params.get_param("askodoo.chat.context_tokens", 4096)),
+        }
+
+    def _reusable_context(self, context_model, settings):
+        """Return the stored provider context when the next turn can continue it, else None."""
+        if not self.llm_context or self.llm_context_model != context_model:
+            return None
+        context = json.loads(self.llm_context)
+        if len(context) >= settings["context_tokens"]:
+            # Start over from the summary and recent turns to keep the context bounded.
+            return None
+        return context
+
+    def _history_text(self):
+        lines = [f"Summary of earlier turns:\n{self.summary}"] if self.summary else []
+        for turn in self.turn_ids.filtered(lambda turn: not turn.summarized):
+            lines.append(f"User: {turn.query}\nAssistant: {turn.answer}")
+            if turn.result:
+                lines.append(f"Result: {turn.result}")
+        return "\n".join(lines)
+
+    @api.model
+    def _turn_values(self, answer):
+        if answer["type"] == "tool_result":
+            result = json.dumps(answer["result"], default=str)
+            if len(result) > TURN_RESULT_CHARS:
+                result = result[:TURN_RESULT_CHARS] + "..."
+            return {"answer": json.dumps(answer["payload"]), "result": result}
+        return {"answer": answer["message"] or "", "result": False}
+
+    def _fold_turns(self, settings):
+        """Fold the turns that left the history window into the summary.
+
+        Each folded turn becomes one shortened line; the oldest lines are
+        dropped once the summary exceeds its token budget.
+        """
+        recent = self.turn_ids.filtered(lambda turn: not turn.summarized)
+        overflow = recent[:max(0, len(recent) - settings["window"])]
+        if not overflow:
+            return
+        lines = (self.summary or "").splitlines()
+        for turn in overflow:
+            query = textwrap.shorten(turn.query, 160, placeholder="...")
+            outcome = f"{turn.answer or ''} => {turn.result}" if turn.result else turn.answer or ""
+            answer = textwrap.shorten(outcome, 160, placeholder="...")
+            lines.append(f"- {query} -> {answer}")
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > settings["summary_tokens"]:
+            lines.pop(0)
+        self.summary = "\n".join(lines)
+        overflow.summarized = True
+
+    @api.model
+    def _answer_from_payload(self, tool_payload, raw_output):
+        # Tool calls are always executed, even when the payload was cached.
         if tool_payload.get("tool") == "orm_call":
-            result = self.env["askodoo.orm.executor"].execute_tool_call(tool_payload)
+            timings = timing.current()
+            with timing.span("execute"):
+                result = self.env["askodoo.orm.executor"].execute_tool_call(
+                    tool_payload, timings=timings.as_dict() if timings else None
+                )
             return {"type": "tool_result", "payload": tool_payload, "result": result}
         return {"type": "message", "message": tool_payload.get("args", {}).get("message", raw_output)}
 
     @api.model
-    def _build_prompt(self, query, rag_docs):
+    def _answer_cache_settings(self):
+        params = self.env["ir.config_parameter"].sudo()
+        return {
+            "enabled": str2bool(params.get_param("askodoo.answer_cache.enabled", "False")),
+            "threshold": float(params.get_param("askodoo.answer_cache.threshold", 0.95)),
+            "ttl": int(params.get_param("askodoo.answer_cache.ttl", 600)),
+            "size": int(params.get_param("askodoo.answer_cache.size", 256)),
+            "generation": (
+                params.get_param("askodoo.schema.generation", "0"),
+                params.get_param("askodoo.rag.corpus_generation", "0"),
+            ),
+        }
+
+    @api.model
+    def _is_cacheable_payload(self, tool_payload):
+        """Only plain answers and read-only ORM calls are worth replaying."""
+        if tool_payload.get("tool") == "respond":
+            return bool(tool_payload.get("args", {}).get("message"))
+        if tool_payload.get("tool") == "orm_call":
+            return tool_payload.get("args", {}).get("method") in ANSWER_CACHE_READ_METHODS
+        return False
+
+    @api.model
+    def ask_stream(self, user_query):
+        """Return an iterator of ``(event, data)`` pairs answering ``user_query``.
+
+        Retrieval and prompt building happen immediately. The iterator
+        forwards completion fragments as ``token`` events while they arrive,
+        executes the tool call once its JSON is complete and ends with a
+        ``result`` event. It does not use the current cursor, so it can be
+        consumed after the request transaction has ended.
+        """
+        rag_docs = self.env["askodoo.rag.document"].semantic_search(
+            user_query, top_k=self._prompt_settings()["candidates"]
+        )
+        connector = self.env["askodoo.llm.connector"].get_connector("completion")
+        prompt, prompt_info = self._build_prompt(user_query, rag_docs)
+        return self._stream_events(connector.complete_text(prompt, stream=True), prompt_info)
+
+    def _stream_events(self, fragments, prompt_info=None):
+        extra = {"prompt": prompt_info} if prompt_info else {}
+        raw_output = ""
+        tool_payload = None
+        for fragment in fragments:
+            raw_output += fragment
+            yield "token", fragment
+            if tool_payload is None:
+                tool_payload = self._detect_tool_call(raw_output)
+                if tool_payload and tool_payload.get("tool") == "orm_call":
+                    result = self._execute_in_new_cursor(tool_payload)
+                    yield "result", {"type": "tool_result", "payload": tool_payload, "result": result, **extra}
+        if tool_payload and tool_payload.get("tool") == "orm_call":
+            return
+        tool_payload = tool_payload or self.env["askodoo.llm.connector"].parse_tool_call(raw_output)
+        message = tool_payload.get("args", {}).get("message", raw_output)
+        yield "result", {"type": "message", "message": message, **extra}
+
+    @api.model
+    def ask_batch(self, queries):
+        """Return an iterator over one result dict per query, in order.
+
+        All queries are embedded in one call and retrieved together, and
+        their completions run concurrently on the connector. Each item
+        carries its ``index``, ``query`` and ``status``; a failing item is
+        reported with ``status`` ``error`` without stopping the others.
+        Like ``ask_stream`` the iterator does not use the current cursor.
+        """
+        queries = list(queries)
+        if not queries:
+            return iter([])
+        connectors = self.env["askodoo.llm.connector"]
+        vectors = connectors.get_connector("embedding").embed_texts(queries)
+        doc_lists = self.env["askodoo.rag.document"].semantic_search_batch(
+            queries, vectors, top_k=self._prompt_settings()["candidates"]
+        )
+        prompts = [self._build_prompt(query, rag_docs) for query, rag_docs in zip(queries, doc_lists)]
+        completions = connectors.get_connector("completion").complete_texts([prompt for prompt, _info in prompts])
+        return self._batch_events(queries, [info for _prompt, info in prompts], completions)
+
+    def _batch_events(self, queries, prompt_infos, completions):
+        connector = self.env["askodoo.llm.connector"]
+        for index, (query, prompt_info, raw_output) in enumerate(zip(queries, prompt_infos, completions)):
+            item = {"index": index, "query": query, "prompt": prompt_info}
+            try:
+                tool_payload = connector.parse_tool_call(raw_output)
+                if tool_payload.get("tool") == "orm_call":
+                    result = self._execute_in_new_cursor(tool_payload)
+                    item.update(type="tool_result", payload=tool_payload, result=result)
+                else:
+                    item.update(type="message", message=tool_payload.get("args", {}).get("message", raw_output))
+                item["status"] = "ok"
+            except Exception as error:  # pylint: disable=broad-except
+                _logger.exception("AskOdoo batch item %s failed", index)
+                item.update(status="error", error=str(error))
+            yield item
+
+    @api.model
+    def _detect_tool_call(self, raw_output):
+        """Return the tool payload once ``raw_output`` holds a complete JSON object."""
+        text = raw_output.lstrip()
+        if not text.startswith("{"):
+            return None
+        try:
+            payload, _end = json.JSONDecoder().raw_decode(text)
+        except json.JSONDecodeError:
+            return None
+        return payload if isinstance(payload, dict) else None
+
+    def _execute_in_new_cursor(self, tool_payload):
+        with self.pool.cursor() as cr:
+            env = api.Environment(cr, self.env.uid, self.env.context, su=self.env.su)
+            return env["askodoo.orm.executor"].execute_tool_call(tool_payload)
+
+    @api.model
+    def _prompt_settings(self):
+        params = self.env["ir.config_parameter"].sudo()
+        return {
+            "token_budget": int(params.get_param("askodoo.prompt.token_budget", 3000)),
+            "candidates": int(params.get_param("askodoo.prompt.candidates", 12)),
+        }
+
+    @api.model
+    def _build_prompt(self, query, rag_docs, history="", sent=None):
+        """Return the prompt for ``query`` and a summary of its size.
+
+        ``rag_docs`` are taken in ranking order, duplicates skipped, and
+        packed into whatever the token budget leaves after the template,
+        the conversation ``history`` and the query; chunks that do not fit
+        are dropped. The digests of the packed chunks are added to ``sent``.
+        """
         template = self.env["askodoo.prompt.template"].search([("active", "=", True)], limit=1)
-        schema_blob = "\n\n".join(doc.content for doc in rag_docs)
-        return (template.body if template else "") + (
-            "\n\nRetrieved grounding:\n"
-            f"{schema_blob}\n\n"
+        head = template.body if template else ""
+        if history:
+            head += "\n\nConversation so far:\n" + history
+        head += "\n\nRetrieved grounding:\n"
+        return self._pack_prompt(head, query, rag_docs, set() if sent is None else sent)
+
+    @api.model
+    def _build_followup_prompt(self, query, rag_docs, sent, previous_result=None):
+        """Return the prompt continuing a provider context that holds the grounding in ``sent``."""
+        head = f"Result of the previous tool call:\n{previous_result}\n\n" if previous_result else ""
+        return self._pack_prompt(head + "Additional grounding:\n", query, rag_docs, sent)
+
+    @api.model
+    def _pack_prompt(self, head, query, rag_docs, sent):
+        tail = (
+            "\n\n"
             "Return JSON tool call when action is required."
             "\nUser Query: "
             f"{query}"
         )
+        remaining = self._prompt_settings()["token_budget"] - estimate_tokens(head) - estimate_tokens(tail)
+        seen = set()
+        chunks = []
+        for doc in rag_docs:
+            content = (doc.content or "").strip()
+            digest = _chunk_digest(content)
+            if not content or content in seen or digest in sent:
+                continue
+            seen.add(content)
+            cost = estimate_tokens(content) + 1
+            if cost > remaining:
+                continue
+            chunks.append(content)
+            sent.add(digest)
+            remaining -= cost
+        prompt = head + "\n\n".join(chunks) + tail
+        return prompt, {
+            "tokens": estimate_tokens(prompt),
+            "chars": len(prompt),
+            "documents": len(chunks),
+            "candidates": len(rag_docs),
+        }
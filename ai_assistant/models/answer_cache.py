@@ -0,0 +1,73 @@
+"""Per-process semantic cache of planned answers for repeated questions."""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class SemanticAnswerCache:
+    """LRU of ``(query vector, tool payload)`` entries matched by cosine similarity.
+
+    Entries are grouped per database and tagged with the schema/RAG
+    generation they were planned against; a generation change drops them.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, dbname, generation, vector, threshold, ttl):
+        norm = _norm(vector)
+        if not norm:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(dbname, generation)
+            best_key, best_score = None, threshold
+            for key, (entry_vector, entry_norm, _payload, stored_at) in list(bucket.items()):
+                if now - stored_at > ttl:
+                    del bucket[key]
+                    continue
+                if len(entry_vector) != len(vector):
+                    continue
+                score = sum(a * b for a, b in zip(vector, entry_vector)) / (norm * entry_norm)
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                return None
+            bucket.move_to_end(best_key)
+            return dict(bucket[best_key][2])
+
+    def put(self, dbname, generation, query, vector, payload, max_size):
+        norm = _norm(vector)
+        if not norm:
+            return
+        with self._lock:
+            bucket = self._bucket(dbname, generation)
+            bucket[query] = (list(vector), norm, dict(payload), time.monotonic())
+            bucket.move_to_end(query)
+            while len(bucket) > max_size:
+                bucket.popitem(last=False)
+
+    def clear(self, dbname=None):
+        with self._lock:
+            if dbname is None:
+                self._buckets.clear()
+            else:
+                self._buckets.pop(dbname, None)
+
+    def _bucket(self, dbname, generation):
+        current = self._buckets.get(dbname)
+        if current is None or current[0] != generation:
+            current = self._buckets[dbname] = (generation, OrderedDict())
+        return current[1]
+
+
+def _norm(vector):
+    return math.sqrt(sum(value * value for value in vector)) if vector else 0.0
+
+
+answer_cache = SemanticAnswerCache()
@@ -1 +1,7 @@
+from . import test_ai_session
+from . import test_cli_daemon
+from . import test_embedding_job
 from . import test_executor
+from . import test_llm_connector
+from . import test_rag_document
+from . import test_schema_extract
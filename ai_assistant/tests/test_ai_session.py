@@ -0,0 +1,163 @@
+"""Unit tests for the chat session orchestration."""
+
+from unittest.mock import patch
+
+from odoo.addons.ai_assistant.models.answer_cache import answer_cache
+from odoo.addons.llm_connector.models import timing
+from odoo.tests.common import TransactionCase
+
+
+class TestAskOdooChatSession(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env['askodoo.chat.session']
+
+    def test_detect_tool_call_waits_for_complete_json(self):
+        self.assertIsNone(self.session._detect_tool_call('{"tool": "orm_call", "args": {'))
+        self.assertIsNone(self.session._detect_tool_call('Sure, here it is'))
+        payload = self.session._detect_tool_call(' {"tool": "respond", "args": {"message": "hi"}} trailing')
+        self.assertEqual(payload['args']['message'], 'hi')
+
+    def test_stream_forwards_tokens_then_message(self):
+        events = list(self.session._stream_events(iter(['Hello', ' world'])))
+        self.assertEqual(events[:2], [('token', 'Hello'), ('token', ' world')])
+        self.assertEqual(events[-1], ('result', {'type': 'message', 'message': 'Hello world'}))
+
+    def test_stream_executes_tool_call_once_complete(self):
+        self.env['askodoo.schema.model'].extract_all_models(model_names=['res.partner'])
+        partner = self.env['res.partner'].create({'name': 'Streamed'})
+        fragments = [
+            '{"tool": "orm_call", "args": {"model": "res.partner", ',
+            '"method": "write", "domain": [["id", "=", %d]], ' % partner.id,
+            '"values": {"name": "Renamed"}}}',
+        ]
+        session_class = type(self.session)
+        with patch.object(session_class, '_execute_in_new_cursor', lambda rec, payload: (
+            rec.env['askodoo.orm.executor'].execute_tool_call(payload)
+        )):
+            events = list(self.session._stream_events(iter(fragments)))
+        self.assertEqual([event for event, _data in events], ['token', 'token', 'token', 'result'])
+        self.assertEqual(events[-1][1]['result']['status'], 'ok')
+        self.assertEqual(partner.name, 'Renamed')
+
+    def test_answer_cache_skips_completion_for_repeated_query(self):
+        self.env['ir.config_parameter'].sudo().set_param('askodoo.answer_cache.enabled', 'True')
+        answer_cache.clear()
+        self.addCleanup(answer_cache.clear)
+        connector_class = type(self.env['askodoo.llm.connector'])
+        completion = '{"tool": "respond", "args": {"message": "Use sale.order.action_confirm"}}'
+        with patch.object(connector_class, 'embed_text', return_value=[0.6, 0.8]), \
+                patch.object(connector_class, 'complete_text', return_value=completion) as complete_text:
+            first = self.session.ask_once('How do I confirm a sales order?')
+            second = self.session.ask_once('How do I confirm a sales order?')
+            self.assertEqual(complete_text.call_count, 1)
+            self.assertEqual(second['message'], first['message'])
+            self.assertTrue(second.get('cached'))
+            self.env['askodoo.rag.document']._bump_corpus_generation()
+            self.assertFalse(self.session.ask_once('How do I confirm a sales order?').get('cached'))
+        self.assertEqual(complete_text.call_count, 2)
+
+    def test_answer_cache_ignores_write_calls(self):
+        payload = {'tool': 'orm_call', 'args': {'model': 'res.partner', 'method': 'write'}}
+        self.assertFalse(self.session._is_cacheable_payload(payload))
+        payload['args']['method'] = 'search_read'
+        self.assertTrue(self.session._is_cacheable_payload(payload))
+
+    def test_prompt_respects_token_budget(self):
+        self.env['ir.config_parameter'].sudo().set_param('askodoo.prompt.token_budget', 400)
+        documents = self.env['askodoo.rag.document'].create([
+            {'name': 'small', 'content': 'Model: res.partner\nMethod: write(vals)'},
+            {'name': 'duplicate', 'content': 'Model: res.partner\nMethod: write(vals)'},
+            {'name': 'large', 'content': 'field ' * 1000},
+            {'name': 'other', 'content': 'Model: sale.order\nMethod: action_confirm()'},
+        ])
+        prompt, info = self.session._build_prompt('Rename a partner', documents)
+        self.assertEqual(info['documents'], 2)
+        self.assertEqual(info['candidates'], 4)
+        self.assertLessEqual(info['tokens'], 400)
+        self.assertEqual(prompt.count('Method: write(vals)'), 1)
+        self.assertIn('action_confirm', prompt)
+        self.assertNotIn('field field', prompt)
+
+    def test_ask_reports_stage_timings(self):
+        self.env['askodoo.llm.connector'].get_default_connector().max_retries = 0
+        connector_class = type(self.env['askodoo.llm.connector'])
+        completion = '{"tool": "respond", "args": {"message": "done"}}'
+        with patch.object(connector_class, '_ollama_completion', return_value=completion):
+            answer = self.session.ask_once('Which partners are companies?')
+            self.assertTrue({'embed', 'search', 'prompt', 'complete', 'parse', 'total'} <= set(answer['timings']))
+            self.assertIn('askodoo_stage_duration_seconds_count{stage="search"', timing.render_prometheus())
+            self.env['ir.config_parameter'].sudo().set_param('askodoo.timing.enabled', 'False')
+            self.assertNotIn('timings', self.session.ask_once('Which partners are companies?'))
+
+    def test_ask_batch_reports_items_in_order(self):
+        self.env['askodoo.llm.connector'].get_default_connector().max_retries = 0
+        connector_class = type(self.env['askodoo.llm.connector'])
+        session_class = type(self.session)
+
+        def complete(rec, prompt, settings_list=None):
+            query = prompt.rsplit('User Query: ', 1)[1]
+            if query == 'rename':
+                return '{"tool": "orm_call", "args": {"model": "res.partner", "method": "write", "domain": []}}'
+            return '{"tool": "respond", "args": {"message": "answer to %s"}}' % query
+
+        def execute(rec, payload):
+            raise RuntimeError('boom')
+
+        with patch.object(connector_class, '_ollama_completion', complete), \
+                patch.object(session_class, '_execute_in_new_cursor', execute):
+            items = list(self.session.ask_batch(['first', 'rename', 'third']))
+        self.assertEqual([item['index'] for item in items], [0, 1, 2])
+        self.assertEqual([item['status'] for item in items], ['ok', 'error', 'ok'])
+        self.assertEqual(items[2]['message'], 'answer to third')
+        self.assertEqual(items[1]['error'], 'boom')
+
+    def test_conversation_reuses_context_and_folds_old_turns(self):
+        params = self.env['ir.config_parameter'].sudo()
+        params.set_param('askodoo.chat.window', 1)
+        connector_class = type(self.env['askodoo.llm.connector'])
+        executor_class = type(self.env['askodoo.orm.executor'])
+        lookup = '{"tool": "orm_call", "args": {"model": "res.partner", "method": "search_read", "domain": []}}'
+        found = {'status': 'ok', 'result': {'ids': [7]}}
+        calls = []
+
+        def generate(rec, prompt, settings_list, context=None):
+            calls.append((prompt, context))
+            reply = '{"tool": "respond", "args": {"message": "reply %d"}}' % len(calls)
+            response = lookup if len(calls) == 1 else reply
+            return {'response': response, 'context': list(range(len(calls) * 10))}
+
+        conversation = self.session.create({'name': 'Follow-ups'})
+        with patch.object(connector_class, 'embed_text', return_value=[0.6, 0.8]), \
+                patch.object(connector_class, '_ollama_generate', generate), \
+                patch.object(executor_class, 'execute_tool_call', return_value=found):
+            conversation.ask('Which partners are companies?')
+            answer = conversation.ask('And which of them are in Belgium?')
+            self.assertEqual(calls[1][1], list(range(10)))
+            self.assertNotIn('Retrieved grounding', calls[1][0])
+            self.assertIn('"ids": [7]', calls[1][0])
+            self.assertEqual(answer['prompt']['reused_tokens'], 10)
+            params.set_param('askodoo.chat.context_tokens', 15)
+            conversation.ask('Only the active ones')
+        self.assertIsNone(calls[2][1])
+        self.assertIn('Conversation so far', calls[2][0])
+        self.assertIn('Which partners are companies?', calls[2][0])
+        self.assertEqual(len(conversation.turn_ids), 3)
+        self.assertIn('"ids": [7]', conversation.turn_ids[0].result)
+        self.assertEqual(conversation.turn_ids.mapped('summarized'), [True, True, False])
+        self.assertIn('reply 2', conversation.summary)
+
+    def test_ask_needs_one_session(self):
+        with self.assertRaises(ValueError):
+            self.session.ask('Which partners are companies?')
+
+    def test_turns_are_private_to_the_session_owner(self):
+        conversation = self.session.create({'name': 'Private'})
+        self.env['askodoo.chat.turn'].create({'session_id': conversation.id, 'query': 'secret', 'answer': 'x'})
+        other = self.env['res.users'].create({
+            'name': 'Other AskOdoo User',
+            'login': 'askodoo_other_user',
+            'groups_id': [(6, 0, [self.env.ref('base.group_user').id])],
+        })
+        self.assertFalse(self.env['askodoo.chat.turn'].with_user(other).search([('query', '=', 'secret')]))
@@ -0,0 +1,106 @@
+"""Unit tests for the CLI daemon protocol; none of them needs a database."""
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from odoo.tests.common import BaseCase
+
+# The CLI runs as a script and imports its siblings by their plain names.
+CLI_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cli')
+if CLI_DIRECTORY not in sys.path:
+    sys.path.insert(0, CLI_DIRECTORY)
+
+import askodoo_cli  # noqa: E402
+import askodoo_daemon  # noqa: E402
+
+
+def _query(db_name, query, emit):
+    emit(f'answering {query}')
+    return {'message': query.upper()}
+
+
+def _fail(db_name, emit):
+    raise RuntimeError('boom')
+
+
+class TestAskOdooDaemon(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        # Unix socket paths are limited to about a hundred characters.
+        self.directory = tempfile.mkdtemp(prefix='askodoo-test-', dir='/tmp')
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.socket_path = os.path.join(self.directory, 'test.sock')
+
+    def _start_daemon(self):
+        daemon = askodoo_daemon.AskOdooDaemon(self.socket_path, 'testdb', {'query': _query, 'fail': _fail})
+        threading.Thread(target=daemon.serve_forever, daemon=True).start()
+        self.addCleanup(daemon.server_close)
+        self.addCleanup(daemon.shutdown)
+        return daemon
+
+    def test_call_streams_output_then_result(self):
+        self._start_daemon()
+        replies = list(askodoo_daemon.call(self.socket_path, 'testdb', 'query', {'query': 'hi'}))
+        self.assertEqual(replies, [('output', 'answering hi'), ('result', {'message': 'HI'})])
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0o777, 0o600)
+
+    def test_handler_reports_errors(self):
+        self._start_daemon()
+        with self.assertLogs('askodoo_daemon', 'ERROR'):
+            replies = list(askodoo_daemon.call(self.socket_path, 'testdb', 'fail', {}))
+        self.assertEqual(replies, [('error', 'boom')])
+        with self.assertLogs('askodoo_daemon', 'ERROR'):
+            replies = list(askodoo_daemon.call(self.socket_path, 'otherdb', 'query', {'query': 'hi'}))
+        self.assertEqual(replies[0][0], 'error')
+        self.assertIn('testdb', replies[0][1])
+        with self.assertLogs('askodoo_daemon', 'ERROR'):
+            replies = list(askodoo_daemon.call(self.socket_path, 'testdb', 'unknown', {}))
+        self.assertEqual(replies[0][0], 'error')
+
+    def test_call_without_daemon_is_unavailable(self):
+        with self.assertRaises(askodoo_daemon.DaemonUnavailable):
+            askodoo_daemon.call(self.socket_path, 'testdb', 'query', {'query': 'hi'})
+
+    def test_call_refuses_daemon_of_another_user(self):
+        self._start_daemon()
+        uid = os.getuid()
+        with patch.object(askodoo_daemon.os, 'getuid', return_value=uid + 1), \
+                self.assertLogs('askodoo_daemon', 'WARNING'), \
+                self.assertRaises(askodoo_daemon.DaemonUnavailable):
+            askodoo_daemon.call(self.socket_path, 'testdb', 'query', {'query': 'hi'})
+
+    def test_claim_socket_replaces_stale_file_only(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket_path)
+        stale.close()
+        daemon = self._start_daemon()
+        with self.assertRaises(RuntimeError):
+            askodoo_daemon.AskOdooDaemon(self.socket_path, 'testdb', {})
+        daemon.shutdown()
+        daemon.server_close()
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_socket_directory_is_private(self):
+        with patch.dict(os.environ, {'XDG_RUNTIME_DIR': self.directory}):
+            path = askodoo_daemon.default_socket_path('testdb')
+            directory = os.path.dirname(path)
+            self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+            os.chmod(directory, 0o755)
+            with self.assertRaises(RuntimeError):
+                askodoo_daemon.default_socket_path('testdb')
+
+    def test_run_command_falls_back_in_process(self):
+        args = SimpleNamespace(db='testdb', socket=self.socket_path, no_daemon=False)
+        with patch.dict(askodoo_cli.COMMANDS, {'query': _query}), patch('builtins.print') as printed:
+            self.assertEqual(askodoo_cli.run_command(args, 'query', query='hi'), {'message': 'HI'})
+            printed.assert_called_once_with('answering hi', flush=True)
+            self._start_daemon()
+            with patch.dict(askodoo_cli.COMMANDS, {'query': _fail}):
+                self.assertEqual(askodoo_cli.run_command(args, 'query', query='hi'), {'message': 'HI'})
@@ -0,0 +1,86 @@
+"""Unit tests for sharded, resumable embedding build jobs."""
+
+from unittest.mock import patch
+
+from odoo.tests.common import TransactionCase
+
+JOB_LOGGER = 'odoo.addons.rag_embedding.models.embedding_job'
+
+
+class TestAskOdooEmbeddingJob(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.jobs = self.env['askodoo.embedding.job']
+        self.jobs.search([]).unlink()
+        schemas = self.env['askodoo.schema.model']
+        # Keep the jobs down to the models created here.
+        schemas.search([]).write({'active': False})
+        self.broken = schemas.create({'model_name': 'x_askodoo.job_broken', 'description': 'Broken'})
+        for name in ('x_askodoo.job_first', 'x_askodoo.job_second'):
+            schemas.create({'model_name': name, 'description': name})
+        self.provider_down = False
+        connector_class = type(self.env['askodoo.llm.connector'])
+        document_class = type(self.env['askodoo.rag.document'])
+        for patcher in (
+            patch.object(connector_class, 'embed_texts', side_effect=self._embed_texts),
+            patch.object(document_class, 'init_pgvector', return_value=False),
+            patch.object(document_class, '_pgvector_ready', return_value=False),
+            patch.object(document_class, '_rebuild_vector_index', return_value=False),
+            # Shards commit on their own; the test transaction must survive them.
+            patch.object(self.env.cr, 'commit'),
+            patch.object(self.env.cr, 'rollback'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _embed_texts(self, texts):
+        if self.provider_down and any('x_askodoo.job_broken' in text for text in texts):
+            raise RuntimeError('provider down')
+        return [[1.0, 0.0] for _text in texts]
+
+    def _shard_of(self, job, schema):
+        return job.shard_ids.filtered(lambda shard: schema in shard.schema_model_ids)
+
+    def test_shards_are_claimed_once_and_requeued_on_resume(self):
+        job = self.jobs.create_build_job(shard_size=1)
+        job.prepare_run()
+        claimed = job._claim_shard()
+        self.assertEqual(claimed.state, 'running')
+        self.assertEqual(job.process_shards(), job.shard_count - 1)
+        self.assertEqual(claimed.state, 'running')
+        self.assertEqual((job.shard_ids - claimed).mapped('state'), ['done'] * (job.shard_count - 1))
+        self.assertFalse(job._claim_shard())
+        # A run interrupted while the shard was running picks it up again.
+        self.assertEqual(self.jobs.get_resumable_job(), job)
+        job.prepare_run()
+        self.assertEqual(claimed.state, 'pending')
+        self.assertEqual(job.process_shards(), 1)
+        self.assertEqual(claimed.state, 'done')
+
+    def test_failed_shard_blocks_finalize_until_retried(self):
+        job = self.jobs.create_build_job(shard_size=1)
+        job.prepare_run()
+        self.provider_down = True
+        with self.assertLogs(JOB_LOGGER, 'ERROR'):
+            job.process_shards()
+        broken = self._shard_of(job, self.broken)
+        self.assertEqual((broken.state, broken.attempts, broken.error), ('failed', 1, 'provider down'))
+        self.assertEqual(job.failed_count, 1)
+        self.assertFalse(job.finalize())
+        self.assertEqual(job.state, 'failed')
+        self.assertEqual(self.jobs.get_resumable_job(), job)
+
+        self.provider_down = False
+        job.prepare_run()
+        self.assertEqual(broken.state, 'pending')
+        self.assertEqual(job.process_shards(), 1)
+        self.assertEqual(broken.state, 'done')
+        stats = job.finalize()
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.get_status()['stats'], stats)
+        # The shards embedded the schema documents, so finalize only hashes them.
+        self.assertGreaterEqual(stats['unchanged'], 3)
+        self.assertFalse(self.jobs.get_resumable_job())
+        document = self.env['askodoo.rag.document'].search([('source_ref', '=', 'x_askodoo.job_broken')])
+        self.assertEqual(document.as_vector(), [1.0, 0.0])
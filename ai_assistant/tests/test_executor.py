@@ -1,5 +1,8 @@
 """Unit tests for method grounding and safe execution."""
 
+from unittest.mock import patch
+
+from odoo.addons.orm_executor.models import orm_executor
 from odoo.tests.common import TransactionCase
 
 
@@ -31,3 +34,139 @@ class TestAskOdooExecutor(TransactionCase):
         result = self.env['askodoo.orm.executor'].execute_tool_call(payload)
         self.assertEqual(result['status'], 'ok')
         self.assertEqual(partner.name, 'New Name')
+
+    def test_deny_override(self):
+        partner = self.env['res.partner'].create({'name': 'Protected'})
+        executor = self.env['askodoo.orm.executor']
+        self.assertTrue(executor._is_allowed('res.partner', 'write'))
+        schema = self.env['askodoo.schema.model'].search([('model_name', '=', 'res.partner')])
+        schema.denied_methods = 'write, unlink'
+        payload = {
+            'tool': 'orm_call',
+            'args': {
+                'model': 'res.partner',
+                'method': 'write',
+                'domain': [('id', '=', partner.id)],
+                'values': {'name': 'Changed'},
+            },
+        }
+        result = executor.execute_tool_call(payload)
+        self.assertEqual(result['status'], 'denied')
+        self.assertEqual(partner.name, 'Protected')
+        self.assertTrue(executor._is_allowed('res.partner', 'exists'))
+
+    def test_large_domain_is_refused(self):
+        self.env['ir.config_parameter'].sudo().set_param('askodoo.executor.max_records', 2)
+        partners = self.env['res.partner'].create([{'name': 'Bulk %s' % index} for index in range(3)])
+        payload = {
+            'tool': 'orm_call',
+            'args': {
+                'model': 'res.partner',
+                'method': 'write',
+                'domain': [('id', 'in', partners.ids)],
+                'values': {'comment': 'touched'},
+            },
+        }
+        result = self.env['askodoo.orm.executor'].execute_tool_call(payload)
+        self.assertEqual(result['status'], 'denied')
+        self.assertEqual(result['count'], 3)
+        self.assertFalse(any(partners.mapped('comment')))
+
+    def test_write_in_batches_with_summary(self):
+        params = self.env['ir.config_parameter'].sudo()
+        params.set_param('askodoo.executor.batch_size', 2)
+        params.set_param('askodoo.executor.result_limit', 3)
+        partners = self.env['res.partner'].create([{'name': 'Batch %s' % index} for index in range(5)])
+        payload = {
+            'tool': 'orm_call',
+            'args': {
+                'model': 'res.partner',
+                'method': 'write',
+                'domain': [('id', 'in', partners.ids)],
+                'values': {'comment': 'batched'},
+            },
+        }
+        result = self.env['askodoo.orm.executor'].execute_tool_call(payload)['result']
+        self.assertEqual((result['count'], result['batches'], len(result['ids'])), (5, 3, 3))
+        self.assertTrue(result['truncated'])
+        self.assertEqual(set(partners.mapped('comment')), {'batched'})
+
+    def test_read_batches_are_truncated(self):
+        params = self.env['ir.config_parameter'].sudo()
+        params.set_param('askodoo.executor.batch_size', 5)
+        params.set_param('askodoo.executor.result_limit', 3)
+        partners = self.env['res.partner'].create([{'name': 'Read %s' % index} for index in range(12)])
+        payload = {
+            'tool': 'orm_call',
+            'args': {'model': 'res.partner', 'method': 'read', 'domain': [('id', 'in', partners.ids)]},
+        }
+        result = self.env['askodoo.orm.executor'].execute_tool_call(payload)['result']
+        self.assertEqual((result['count'], result['batches']), (12, 3))
+        self.assertTrue(result['truncated'])
+        first, second, last = result['results']
+        self.assertEqual((first['count'], len(first['items'])), (5, 3))
+        self.assertEqual([row['id'] for row in first['items']], result['ids'])
+        self.assertEqual((second['count'], len(second['items'])), (5, 3))
+        self.assertEqual(len(last), 2)
+
+    def _buffer_logs(self, buffer_size):
+        """Start from an empty log buffer whose inserts run on the test transaction."""
+        params = self.env['ir.config_parameter'].sudo()
+        params.set_param('askodoo.execution_log.buffer_size', buffer_size)
+        params.set_param('askodoo.execution_log.flush_interval', 3600)
+        self.env.cr.postcommit.clear()
+        self.registry.enter_test_mode(self.cr)
+        self.addCleanup(self.registry.leave_test_mode)
+        self.addCleanup(self.env['askodoo.orm.executor']._flush_log_buffer)
+
+    def test_logs_are_buffered_and_capped(self):
+        self._buffer_logs(100)
+        self.env['ir.config_parameter'].sudo().set_param('askodoo.execution_log.max_field_size', 50)
+        logs = self.env['askodoo.execution.log'].sudo()
+        before = logs.search_count([])
+        payload = {
+            'tool': 'orm_call',
+            'args': {'model': 'res.partner', 'method': 'action_nonexistent', 'domain': [('name', '=', 'x' * 200)]},
+        }
+        executor = self.env['askodoo.orm.executor']
+        executor.execute_tool_call(payload)
+        executor.execute_tool_call(payload)
+        self.assertEqual(logs.search_count([]), before)
+        # Committed entries wait in the worker buffer until it is full or old enough.
+        self.env.cr.postcommit.run()
+        self.assertEqual(logs.search_count([]), before)
+        self.assertEqual(executor._flush_log_buffer(), 2)
+        entries = logs.search([], order='id desc', limit=2)
+        self.assertEqual(logs.search_count([]), before + 2)
+        self.assertEqual(set(entries.mapped('status')), {'denied'})
+        self.assertTrue(all(entry.domain_json.endswith('more chars]') for entry in entries))
+
+    def test_allowed_and_denied_calls_are_inserted_together(self):
+        self._buffer_logs(3)
+        logs = self.env['askodoo.execution.log'].sudo()
+        before = logs.search_count([])
+        partner = self.env['res.partner'].create({'name': 'Logged'})
+        write = {
+            'tool': 'orm_call',
+            'args': {
+                'model': 'res.partner',
+                'method': 'write',
+                'domain': [('id', '=', partner.id)],
+                'values': {'comment': 'logged'},
+            },
+        }
+        denied = {'tool': 'orm_call', 'args': {'model': 'res.partner', 'method': 'action_nonexistent'}}
+        executor = self.env['askodoo.orm.executor']
+        for payload in (write, denied, write):
+            executor.execute_tool_call(payload)
+        # The savepoints of the allowed calls do not flush the rows early.
+        self.assertEqual(logs.search_count([]), before)
+        self.assertEqual(len(self.env.cr.postcommit.data[orm_executor.LOG_BUFFER_KEY]), 3)
+        with patch.object(orm_executor, 'execute_values', wraps=orm_executor.execute_values) as insert:
+            self.env.cr.postcommit.run()
+        insert.assert_called_once()
+        self.assertFalse(orm_executor._log_buffers.get(self.env.cr.dbname))
+        entries = logs.search([], order='id desc', limit=3)
+        self.assertEqual(logs.search_count([]), before + 3)
+        self.assertEqual(sorted(entries.mapped('status')), ['denied', 'ok', 'ok'])
+        self.assertEqual(entries.mapped('user_id'), self.env.user)
@@ -0,0 +1,159 @@
+"""Unit tests for batched and cached embeddings against a local stub provider."""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from odoo.addons.llm_connector.models import http_pool, timing
+from odoo.addons.llm_connector.models.embedding_cache import _memory_cache
+from odoo.addons.llm_connector.models.llm_connector import FallbackVector
+from odoo.tests.common import TransactionCase
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Answers /api/embed with one small vector per input text."""
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            fail = server.failures > 0
+            server.failures -= 1 if fail else 0
+        time.sleep(server.latency)
+        with server.lock:
+            server.in_flight -= 1
+        if fail:
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = json.dumps({'embeddings': [[float(len(text)), 1.0] for text in payload['input']]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAskOdooLLMConnector(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server = self._start_server()
+        self.addCleanup(http_pool.reset)
+        self.env['ir.config_parameter'].sudo().set_param('askodoo.embedding_cache.enabled', 'False')
+        self.connector = self.env['askodoo.llm.connector'].create({
+            'name': 'Stub Ollama',
+            'provider': 'ollama',
+            'base_url': 'http://127.0.0.1:%s' % self.server.server_address[1],
+            'embedding_batch_size': 4,
+            'embedding_concurrency': 4,
+            'retry_backoff': 0.0,
+        })
+
+    def _start_server(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubOllamaHandler)
+        server.lock = threading.Lock()
+        server.requests = server.in_flight = server.max_in_flight = 0
+        server.failures = 0
+        server.latency = 0.05
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_embed_texts_batches_in_order(self):
+        texts = ['x' * size for size in range(1, 11)]
+        vectors = self.connector.embed_texts(texts)
+        self.assertEqual([vector[0] for vector in vectors], [float(size) for size in range(1, 11)])
+        self.assertEqual(self.server.requests, 3)
+
+    def test_embed_texts_runs_batches_concurrently(self):
+        self.connector.embed_texts(['text %s' % index for index in range(16)])
+        self.assertEqual(self.server.requests, 4)
+        self.assertGreater(self.server.max_in_flight, 1)
+
+    def test_failed_batch_is_retried(self):
+        self.server.failures = 1
+        self.connector.embedding_concurrency = 1
+        vectors = self.connector.embed_texts(['abc'])
+        self.assertEqual(vectors, [[3.0, 1.0]])
+        self.assertEqual(self.server.requests, 2)
+
+    def test_open_circuit_fails_fast(self):
+        self.server.failures = 10
+        self.connector.write({'max_retries': 0, 'breaker_threshold': 1, 'breaker_cooldown': 60})
+        fallback = self.env['askodoo.llm.connector']._deterministic_fallback_embedding('abc')
+        self.assertEqual(self.connector.embed_text('abc'), fallback)
+        self.assertIsInstance(self.connector.embed_text('abc'), FallbackVector)
+        self.assertEqual(self.connector.embed_text('abcd'), self.connector._deterministic_fallback_embedding('abcd'))
+        self.assertEqual(self.server.requests, 1)
+
+    def test_provider_without_key_returns_fallback_vectors(self):
+        self.connector.write({'provider': 'openai', 'api_key': False})
+        vectors = self.connector.embed_texts(['abc'])
+        self.assertEqual(vectors, [self.connector._deterministic_fallback_embedding('abc')])
+        self.assertIsInstance(vectors[0], FallbackVector)
+        self.assertEqual(self.server.requests, 0)
+
+    def test_pool_fails_over_and_ejects_unhealthy_backend(self):
+        self.server.failures = 10
+        self.connector.write({
+            'pool_name': 'stub',
+            'max_retries': 0,
+            'breaker_threshold': 1,
+            'breaker_cooldown': 60,
+        })
+        backup_server = self._start_server()
+        backup = self.connector.copy({
+            'name': 'Stub Ollama Backup',
+            'base_url': 'http://127.0.0.1:%s' % backup_server.server_address[1],
+        })
+        self.env['ir.config_parameter'].sudo().set_param('askodoo.llm.embedding_pool', 'stub')
+        self.assertEqual(self.connector.embed_texts(['abc']), [[3.0, 1.0]])
+        self.assertEqual(backup_server.requests, 1)
+        self.assertEqual(self.env['askodoo.llm.connector'].get_connector('embedding'), backup)
+        self.assertEqual(self.connector.embed_text('abcd'), [4.0, 1.0])
+        self.assertEqual(self.server.requests, 1)
+
+    def test_embedding_cache_serves_repeated_texts(self):
+        self.env['ir.config_parameter'].sudo().set_param('askodoo.embedding_cache.enabled', 'True')
+        _memory_cache.clear()
+        self.addCleanup(_memory_cache.clear)
+        first = self.connector.embed_texts(['confirm sales order', 'confirm sales order'])
+        second = self.connector.embed_text('confirm sales order')
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(first, [second, second])
+        _memory_cache.clear()
+        self.assertEqual(self.connector.embed_text('confirm sales order'), second)
+        self.assertEqual(self.server.requests, 1)
+        self.assertGreaterEqual(self.env['askodoo.embedding.cache'].get_cache_stats()['db_hits'], 1)
+
+    def test_metrics_merge_workers_and_keep_exited_ones(self):
+        directory = tempfile.mkdtemp(prefix='askodoo-metrics-')
+        self.addCleanup(shutil.rmtree, directory, True)
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        with patch.object(timing, 'metrics_directory', return_value=directory), \
+                patch.dict(timing._counters, clear=True), patch.dict(timing._histograms, clear=True):
+            timing.count('queries')
+            for pid, queries in ((exited.pid, 5), (os.getppid(), 2)):
+                with open(os.path.join(directory, f'{pid}.json'), 'w') as handle:
+                    json.dump({'histograms': {}, 'counters': {'queries': queries}}, handle)
+            self.assertIn('askodoo_queries_total 8\n', timing.render_prometheus())
+            # The exited worker moved to the archive and is not counted twice.
+            self.assertFalse(os.path.exists(os.path.join(directory, f'{exited.pid}.json')))
+            self.assertIn('askodoo_queries_total 8\n', timing.render_prometheus())
@@ -0,0 +1,127 @@
+"""Unit tests for document chunking and retrieval."""
+
+import json
+import shutil
+import tempfile
+from unittest import skipUnless
+from unittest.mock import patch
+
+from odoo.addons.llm_connector.models.llm_connector import FallbackVector
+from odoo.addons.rag_embedding.models import vector_index
+from odoo.tests.common import TransactionCase
+
+
+class TestAskOdooRagDocument(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.document = self.env['askodoo.rag.document']
+        self.env['ir.config_parameter'].sudo().set_param('askodoo.rag.retrieval_mode', 'python')
+        self.document.search([('source_type', '=', 'knowledge')]).unlink()
+
+    def _create(self, ref, content, vector):
+        return self.document.create({
+            'name': ref,
+            'source_type': 'knowledge',
+            'source_ref': ref,
+            'content': content,
+            'embedding_json': json.dumps(vector),
+        })
+
+    def test_hybrid_search_promotes_exact_names(self):
+        exact = self._create('sale.order.action_confirm', 'Method: action_confirm()', [0.8, 0.6])
+        similar = self._create('crm.lead', 'Lead pipeline stages', [1.0, 0.0])
+        search_args = ('Confirm sale order SO123',)
+        search_kwargs = {'top_k': 2, 'source_types': ['knowledge'], 'query_vector': [1.0, 0.0]}
+        self.assertEqual(self.document.semantic_search(*search_args, **search_kwargs)[0], exact)
+        self.env['ir.config_parameter'].sudo().set_param('askodoo.rag.hybrid', 'False')
+        self.assertEqual(self.document.semantic_search(*search_args, **search_kwargs)[0], similar)
+
+    def test_hybrid_search_counts_lexical_candidates_once(self):
+        lexical = self._create('sale.order.copy', 'Confirm sale order copy', [0.1, 1.0])
+        similar = self._create('crm.lead', 'Lead pipeline stages', [1.0, 0.0])
+        document_class = type(self.document)
+        rrf_fuse = document_class._rrf_fuse
+        with patch.object(document_class, '_rrf_fuse', autospec=True, side_effect=rrf_fuse) as fuse:
+            self.document.semantic_search(
+                'Confirm sale order', top_k=2, source_types=['knowledge'], query_vector=[1.0, 0.0]
+            )
+        rankings = fuse.call_args.args[1]
+        self.assertEqual(rankings, [[lexical.id], [similar.id, lexical.id]])
+
+    def test_rrf_fuse_rewards_agreement(self):
+        self.assertEqual(self.document._rrf_fuse([[1, 2, 3], [3, 2, 1], [2]], 2), [2, 1])
+
+    def test_vectors_round_trip_binary_storage(self):
+        document = self._create('res.partner', 'Contacts', [0.5, -1.0, 0.25])
+        self.document.convert_vector_storage(mode='float32')
+        self.assertFalse(document.embedding_json)
+        self.assertEqual(document.as_vector(), [0.5, -1.0, 0.25])
+        self.document.convert_vector_storage(mode='int8')
+        for value, expected in zip(document.as_vector(), [0.5, -1.0, 0.25]):
+            self.assertAlmostEqual(value, expected, delta=0.01)
+        results = self.document.semantic_search(
+            'unrelated', top_k=1, source_types=['knowledge'], query_vector=[0.5, -1.0, 0.25]
+        )
+        self.assertEqual(results, document)
+
+    def test_fallback_embeddings_are_retried_on_next_build(self):
+        connector = self.env['askodoo.llm.connector'].get_default_connector()
+        spec = {'name': 'retry', 'source_type': 'knowledge', 'source_ref': 'retry', 'content': 'Retry me'}
+        connector_class = type(connector)
+        with patch.object(connector_class, 'embed_texts', return_value=[FallbackVector([0.5, 0.5])]):
+            stats = self.document._sync_documents([spec], connector, False)
+        self.assertEqual((stats['created'], stats['fallback']), (1, 1))
+        document = self.document.search([('source_type', '=', 'knowledge'), ('source_ref', '=', 'retry')])
+        self.assertFalse(document.content_hash)
+        with patch.object(connector_class, 'embed_texts', return_value=[[1.0, 0.0]]):
+            stats = self.document._sync_documents([spec], connector, False)
+        self.assertEqual((stats['updated'], stats['fallback']), (1, 0))
+        self.assertTrue(document.content_hash)
+        self.assertEqual(document.as_vector(), [1.0, 0.0])
+
+    def test_corpus_generation_moves_once_per_changed_build(self):
+        connector = self.env['askodoo.llm.connector'].get_default_connector()
+        spec = {'name': 'once', 'source_type': 'knowledge', 'source_ref': 'once', 'content': 'Bump once'}
+        model_class = type(self.document)
+        embed = patch.object(type(connector), 'embed_texts', side_effect=lambda texts: [[1.0, 0.0]] * len(texts))
+        with embed, \
+                patch.object(model_class, '_rebuild_vector_index'), \
+                patch.object(model_class, '_bump_corpus_generation') as bump:
+            self.document._sync_documents([spec], connector, False)
+            bump.assert_not_called()
+            self.env['askodoo.schema.model'].create({'model_name': 'x_askodoo.once', 'description': 'Once'})
+            self.assertGreater(self.document.build_schema_embeddings()['created'], 0)
+            bump.assert_called_once()
+            self.document.build_schema_embeddings()
+            bump.assert_called_once()
+
+    @skipUnless(vector_index.available(), 'numpy is required for the memory-mapped index')
+    def test_batch_search_skips_documents_deleted_since_indexing(self):
+        self.env['ir.config_parameter'].sudo().set_param('askodoo.rag.hybrid', 'False')
+        kept = self._create('kept', 'Kept', [1.0, 0.0])
+        deleted = self._create('deleted', 'Deleted', [0.9, 0.1])
+        index = vector_index.build_index(
+            [kept.id, deleted.id], ['knowledge', 'knowledge'], [[1.0, 0.0], [0.9, 0.1]]
+        )
+        deleted.unlink()
+        with patch.object(type(self.document), '_batch_dense_index', return_value=index):
+            results = self.document.semantic_search_batch(
+                ['first', 'second'], [[1.0, 0.0], [0.9, 0.1]], top_k=2, source_types=['knowledge']
+            )
+        self.assertEqual(results, [kept, kept])
+
+    @skipUnless(vector_index.available(), 'numpy is required for the memory-mapped index')
+    def test_rebuild_index_of_empty_corpus(self):
+        self.env.cr.execute(
+            "UPDATE askodoo_rag_document SET embedding_json = NULL, vector_blob = NULL, vector_format = NULL"
+        )
+        self.document.invalidate_model()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        with patch.object(vector_index, 'index_directory', lambda dbname: directory):
+            generation = self.document._rebuild_vector_index()
+            index = vector_index.load_index(self.env.cr.dbname, generation)
+        self.addCleanup(vector_index._loaded.pop, self.env.cr.dbname, None)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.search([1.0, 0.0], 5), [])
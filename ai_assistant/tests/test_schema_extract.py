@@ -0,0 +1,38 @@
+"""Unit tests for incremental schema extraction."""
+
+from odoo.tests.common import TransactionCase
+
+
+class TestAskOdooSchemaExtract(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.schema_model = self.env['askodoo.schema.model']
+        self.schema_model.extract_all_models()
+        self.partner_schema = self.schema_model.search([('model_name', '=', 'res.partner')])
+
+    def test_unchanged_models_are_skipped(self):
+        self.assertTrue(self.partner_schema.fingerprint)
+        self.assertEqual(self.schema_model.extract_all_models(), 0)
+
+    def test_changed_model_keeps_method_rows(self):
+        method_ids = set(self.partner_schema.method_ids.ids)
+        self.partner_schema.fingerprint = 'stale'
+        self.assertEqual(self.schema_model.extract_all_models(model_names=['res.partner']), 1)
+        self.assertNotEqual(self.partner_schema.fingerprint, 'stale')
+        self.assertEqual(set(self.partner_schema.method_ids.ids), method_ids)
+
+    def test_generation_bumped_on_change(self):
+        params = self.env['ir.config_parameter'].sudo()
+        generation = int(params.get_param('askodoo.schema.generation', 0))
+        self.partner_schema.fingerprint = 'stale'
+        self.schema_model.extract_all_models(model_names=['res.partner'])
+        self.assertGreater(int(params.get_param('askodoo.schema.generation')), generation)
+
+    def test_inherited_methods_stored_once(self):
+        users_schema = self.schema_model.search([('model_name', '=', 'res.users')])
+        base_methods = self.env['askodoo.schema.method'].search([('name', '=', 'ensure_one'), ('is_base', '=', True)])
+        self.assertEqual(len(base_methods), 1)
+        self.assertIn(base_methods, self.partner_schema.method_ids)
+        self.assertIn(base_methods, users_schema.method_ids)
+        self.assertNotIn(base_methods, self.partner_schema.own_method_ids)
@@ -4,6 +4,6 @@
     "summary": "Multi-provider LLM and embedding integration layer.",
     "license": "LGPL-3",
     "depends": ["base"],
-    "data": ["security/ir.model.access.csv", "data/default_connector.xml"],
+    "data": ["security/ir.model.access.csv", "data/default_connector.xml", "data/ir_cron.xml"],
     "installable": True,
 }
@@ -1 +1,2 @@
 from . import llm_connector
+from . import embedding_cache
@@ -0,0 +1,191 @@
+"""Two-level embedding cache: in-process LRU in front of a database table."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from psycopg2.extras import execute_values
+
+from odoo import api, fields, models
+from odoo.tools import str2bool
+
+_logger = logging.getLogger(__name__)
+
+
+class EmbeddingLRU:
+    """Thread-safe, size-bounded LRU of embeddings with a time to live."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key, ttl):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            vector, stored_at = entry
+            if ttl and time.monotonic() - stored_at > ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return vector
+
+    def put(self, key, vector, max_size):
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def count(self, counter, amount=1):
+        with self._lock:
+            self.stats[counter] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, memory_size=len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_memory_cache = EmbeddingLRU()
+
+
+class AskOdooEmbeddingCache(models.Model):
+    """Embeddings keyed by connector embedding model and SHA-256 of the text."""
+
+    _name = "askodoo.embedding.cache"
+    _description = "AskOdoo Embedding Cache"
+    _log_access = False
+
+    model_key = fields.Char(required=True, help="Provider and embedding model, e.g. ollama:nomic-embed-text.")
+    text_hash = fields.Char(required=True, help="SHA-256 of the embedded text.")
+    vector_json = fields.Text(required=True)
+    last_used = fields.Datetime(required=True, index=True, default=fields.Datetime.now)
+
+    _sql_constraints = [
+        ("askodoo_embedding_cache_unique", "unique(model_key, text_hash)", "Embedding already cached."),
+    ]
+
+    @api.model
+    def _cache_settings(self):
+        params = self.env["ir.config_parameter"].sudo()
+        return {
+            "enabled": str2bool(params.get_param("askodoo.embedding_cache.enabled", "True")),
+            "memory_size": int(params.get_param("askodoo.embedding_cache.memory_size", 2048)),
+            "ttl_days": int(params.get_param("askodoo.embedding_cache.ttl_days", 30)),
+            "max_rows": int(params.get_param("askodoo.embedding_cache.max_rows", 200000)),
+        }
+
+    @api.model
+    def _text_hash(self, text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @api.model
+    def lookup(self, model_key, texts):
+        """Return ``{text: vector}`` for the cached entries among ``texts``."""
+        settings = self._cache_settings()
+        if not settings["enabled"]:
+            return {}
+        ttl = settings["ttl_days"] * 86400
+        dbname = self.env.cr.dbname
+        found = {}
+        missing = {}
+        for text in set(texts):
+            text_hash = self._text_hash(text)
+            vector = _memory_cache.get((dbname, model_key, text_hash), ttl)
+            if vector is None:
+                missing[text_hash] = text
+            else:
+                found[text] = vector
+        _memory_cache.count("memory_hits", len(found))
+        if missing:
+            self.env.cr.execute(
+                f"""
+                SELECT id, text_hash, vector_json, last_used < (now() at time zone 'UTC') - interval '1 hour'
+                  FROM {self._table}
+                 WHERE model_key = %s
+                   AND text_hash IN %s
+                   AND last_used > (now() at time zone 'UTC') - interval '1 day' * %s
+                """,
+                (model_key, tuple(missing), settings["ttl_days"]),
+            )
+            touch = []
+            for cache_id, text_hash, vector_json, stale in self.env.cr.fetchall():
+                vector = json.loads(vector_json)
+                found[missing.pop(text_hash)] = vector
+                _memory_cache.put((dbname, model_key, text_hash), vector, settings["memory_size"])
+                _memory_cache.count("db_hits")
+                if stale:
+                    touch.append(cache_id)
+            if touch:
+                # Refresh recency coarsely and never wait on rows another worker holds.
+                self.env.cr.execute(
+                    f"""
+                    UPDATE {self._table}
+                       SET last_used = now() at time zone 'UTC'
+                     WHERE id IN (SELECT id FROM {self._table} WHERE id IN %s FOR UPDATE SKIP LOCKED)
+                    """,
+                    (tuple(touch),),
+                )
+        _memory_cache.count("misses", len(missing))
+        return found
+
+    @api.model
+    def store(self, model_key, vectors_by_text):
+        """Persist freshly computed ``{text: vector}`` embeddings."""
+        settings = self._cache_settings()
+        if not settings["enabled"] or not vectors_by_text:
+            return
+        dbname = self.env.cr.dbname
+        rows = []
+        for text, vector in vectors_by_text.items():
+            text_hash = self._text_hash(text)
+            _memory_cache.put((dbname, model_key, text_hash), vector, settings["memory_size"])
+            rows.append((model_key, text_hash, json.dumps(vector)))
+        execute_values(
+            self.env.cr._obj,
+            f"""
+            INSERT INTO {self._table} (model_key, text_hash, vector_json, last_used)
+            VALUES %s
+            ON CONFLICT (model_key, text_hash) DO NOTHING
+            """,
+            rows,
+            template="(%s, %s, %s, now() at time zone 'UTC')",
+        )
+
+    @api.model
+    def get_cache_stats(self):
+        """Hit/miss counters of this worker's cache plus the stored row count."""
+        self.env.cr.execute(f"SELECT count(*) FROM {self._table}")
+        return dict(_memory_cache.snapshot(), db_rows=self.env.cr.fetchone()[0])
+
+    @api.model
+    def _gc_embedding_cache(self):
+        """Cron: drop entries past their TTL, then the least recently used beyond ``max_rows``."""
+        settings = self._cache_settings()
+        self.env.cr.execute(
+            f"DELETE FROM {self._table} WHERE last_used < (now() at time zone 'UTC') - interval '1 day' * %s",
+            (settings["ttl_days"],),
+        )
+        expired = self.env.cr.rowcount
+        self.env.cr.execute(
+            f"""
+            DELETE FROM {self._table}
+             WHERE id IN (
+                SELECT id FROM {self._table} ORDER BY last_used DESC OFFSET %s
+             )
+            """,
+            (settings["max_rows"],),
+        )
+        _logger.info("AskOdoo embedding cache GC: %s expired, %s evicted", expired, self.env.cr.rowcount)
@@ -0,0 +1,160 @@
+"""Per-process keep-alive HTTP sessions, circuit breakers and load statistics for LLM providers."""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_sessions = {}
+_breakers = {}
+_stats = {}
+
+
+def get_session(key, pool_size):
+    """Return the shared session for ``key``, creating it on first use."""
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size), max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[key] = session
+        return session
+
+
+def get_breaker(key, threshold, cooldown):
+    with _lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker(key, threshold, cooldown)
+        else:
+            breaker.threshold, breaker.cooldown = threshold, cooldown
+        return breaker
+
+
+def get_stats(key):
+    with _lock:
+        stats = _stats.get(key)
+        if stats is None:
+            stats = _stats[key] = BackendStats()
+        return stats
+
+
+def load_score(key):
+    """Return the routing cost of backend ``key``: lower is better, infinite while ejected.
+
+    Requests in flight are weighted by the observed latency, so a slow
+    backend receives proportionally less traffic.
+    """
+    with _lock:
+        breaker = _breakers.get(key)
+        stats = _stats.get(key)
+    if breaker is not None and breaker.is_ejected():
+        return float("inf")
+    if stats is None:
+        return 0.0
+    return (stats.in_flight + 1) * max(stats.latency_ms, 1.0)
+
+
+def reset():
+    """Close every pooled session and forget breaker and load state."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _breakers.clear()
+        _stats.clear()
+
+
+class BackendStats:
+    """Requests in flight and an exponentially weighted latency for one backend."""
+
+    ALPHA = 0.3
+
+    def __init__(self):
+        self.in_flight = 0
+        self.latency_ms = 0.0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self):
+        with self._lock:
+            self.in_flight += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = (time.monotonic() - started) * 1000.0
+            with self._lock:
+                self.in_flight -= 1
+                self.requests += 1
+                if self.requests == 1:
+                    self.latency_ms = elapsed
+                else:
+                    self.latency_ms += self.ALPHA * (elapsed - self.latency_ms)
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive failures and probes again after ``cooldown`` seconds."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, key, threshold, cooldown):
+        self.key = key
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return whether a request may be sent now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                # Let exactly one probe through; others keep failing fast.
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def is_ejected(self):
+        """Whether routing should avoid this backend: open and cooling down, or probing."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                return True
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.cooldown
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                _logger.info("AskOdoo provider %s recovered, closing circuit", self.key)
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    _logger.warning(
+                        "AskOdoo provider %s failed %s times, opening circuit for %ss",
+                        self.key,
+                        self.failures,
+                        self.cooldown,
+                    )
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
@@ -4,11 +4,38 @@ from __future__ import annotations
 
 import hashlib
 import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
 from odoo import api, fields, models
 
+from . import http_pool, timing
+
+_logger = logging.getLogger(__name__)
+
+UNAVAILABLE_COMPLETION = "{\"tool\": \"respond\", \"args\": {\"message\": \"No LLM response available\"}}"
+
+
+class ProviderError(Exception):
+    """Raised when a provider request fails."""
+
+    def __init__(self, message, status=None, retryable=False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+class FallbackVector(list):
+    """Deterministic stand-in for an embedding the provider failed to return.
+
+    It compares equal to a plain list; callers that persist embeddings
+    check for it so that the text is embedded again later.
+    """
+
 
 class AskOdooLLMConnector(models.Model):
     """Connector records holding provider credentials and invocation logic."""
@@ -28,45 +55,417 @@ class AskOdooLLMConnector(models.Model):
     base_url = fields.Char(default="http://localhost:11434")
     active = fields.Boolean(default=True)
     is_default = fields.Boolean(default=False)
+    pool_name = fields.Char(
+        index=True,
+        help="Connectors sharing a pool name share its traffic and fail over to each other.",
+    )
+    embedding_batch_size = fields.Integer(default=32, help="Texts sent per embedding request.")
+    embedding_concurrency = fields.Integer(default=2, help="Embedding batches sent in parallel.")
+    completion_concurrency = fields.Integer(default=4, help="Completions sent in parallel by batch queries.")
+    max_retries = fields.Integer(default=3, help="Retries for a failed provider request.")
+    retry_backoff = fields.Float(default=0.5, help="Initial retry delay in seconds, doubled on each retry.")
+    connect_timeout = fields.Float(default=3.0, help="Seconds allowed to open a connection to the provider.")
+    read_timeout = fields.Float(default=60.0, help="Seconds allowed for the provider to answer a request.")
+    pool_size = fields.Integer(default=8, help="Keep-alive connections kept per worker process.")
+    breaker_threshold = fields.Integer(
+        default=5,
+        help="Consecutive failures after which requests fail fast to the fallback.",
+    )
+    breaker_cooldown = fields.Float(default=30.0, help="Seconds before a failing provider is probed again.")
+    keep_alive = fields.Char(
+        default="10m",
+        help="How long Ollama keeps the model loaded after a completion, e.g. 10m, or -1 to keep it loaded.",
+    )
 
     def get_default_connector(self):
         connector = self.search([("is_default", "=", True), ("active", "=", True)], limit=1)
         return connector or self.search([("active", "=", True)], limit=1)
 
+    @api.model
+    def get_connector(self, purpose="completion"):
+        """Return the connector that should serve ``embedding`` or ``completion`` traffic.
+
+        When ``askodoo.llm.<purpose>_pool`` names a pool, its least loaded
+        healthy member is returned: the fewest requests in flight weighted
+        by observed latency, skipping backends whose circuit is open.
+        Otherwise the default connector is used.
+        """
+        pool = self.env["ir.config_parameter"].sudo().get_param(f"askodoo.llm.{purpose}_pool")
+        members = pool and self.search([("pool_name", "=", pool), ("active", "=", True)])
+        if not members:
+            return self.get_default_connector()
+        return min(members, key=lambda member: (http_pool.load_score(member._backend_key()), random.random()))
+
+    def _backend_key(self):
+        self.ensure_one()
+        return (self.env.cr.dbname, self.id, (self.base_url or "").rstrip("/"))
+
+    def _peer_settings(self, purpose):
+        """Request settings of the other pool members able to take over ``purpose`` traffic, best first."""
+        self.ensure_one()
+        if not self.pool_name:
+            return []
+        domain = [
+            ("pool_name", "=", self.pool_name),
+            ("active", "=", True),
+            ("id", "!=", self.id),
+            ("provider", "=", self.provider),
+        ]
+        if purpose == "embedding":
+            # Vectors from another embedding model would not be comparable.
+            domain.append(("embedding_model", "=", self.embedding_model))
+        peers = self.search(domain).sorted(lambda peer: http_pool.load_score(peer._backend_key()))
+        return [peer._request_settings() for peer in peers]
+
     def embed_text(self, text):
         self.ensure_one()
-        if self.provider == "ollama":
-            return self._ollama_embedding(text)
-        return self._deterministic_fallback_embedding(text)
+        return self.embed_texts([text])[0]
+
+    def embed_texts(self, texts):
+        """Embed ``texts`` using provider batch endpoints, preserving order.
+
+        Texts already in the embedding cache are served from it. The others
+        are sent in batches of ``embedding_batch_size`` by up to
+        ``embedding_concurrency`` threads. A batch that still fails after
+        its retries is tried on the other members of the connector's pool,
+        then gets deterministic ``FallbackVector`` embeddings, which are not
+        cached.
+        """
+        self.ensure_one()
+        texts = list(texts)
+        if not texts:
+            return []
+        with timing.span("embed"):
+            return self._embed_texts(texts)
+
+    def _embed_texts(self, texts):
+        if self.provider != "ollama" and not self.api_key:
+            # Stubs too: they must be embedded again once a key is configured.
+            return [FallbackVector(self._deterministic_fallback_embedding(text)) for text in texts]
+        cache = self.env["askodoo.embedding.cache"]
+        model_key = self._embedding_cache_key()
+        vectors = cache.lookup(model_key, texts)
+        missing = list(dict.fromkeys(text for text in texts if text not in vectors))
+        if missing:
+            settings_list = [self._request_settings()] + self._peer_settings("embedding")
+            size = max(1, self.embedding_batch_size or 1)
+            batches = [missing[i:i + size] for i in range(0, len(missing), size)]
+            workers = max(1, min(self.embedding_concurrency or 1, len(batches)))
+            if workers == 1:
+                results = [self._embed_batch(settings_list, batch) for batch in batches]
+            else:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="askodoo-embed") as pool:
+                    results = list(pool.map(lambda batch: self._embed_batch(settings_list, batch), batches))
+            computed = {}
+            for batch, batch_vectors in zip(batches, results):
+                if batch_vectors is None:
+                    vectors.update(
+                        (text, FallbackVector(self._deterministic_fallback_embedding(text))) for text in batch
+                    )
+                else:
+                    computed.update(zip(batch, batch_vectors))
+            cache.store(model_key, computed)
+            vectors.update(computed)
+        return [vectors[text] for text in texts]
+
+    def _embedding_cache_key(self):
+        self.ensure_one()
+        return f"{self.provider}:{self.embedding_model}"
+
+    def complete_text(self, prompt, stream=False):
+        """Return the completion of ``prompt``.
 
-    def complete_text(self, prompt):
+        With ``stream`` an iterator of text fragments is returned instead. It
+        only uses the network, so it can be consumed after the request
+        cursor is closed.
+        """
         self.ensure_one()
         if self.provider == "ollama":
-            return self._ollama_completion(prompt)
-        return (
+            if stream:
+                return self._ollama_stream_completion(self._request_settings(), prompt)
+            settings_list = [self._request_settings()] + self._peer_settings("completion")
+            with timing.span("complete"):
+                return self._ollama_completion(prompt, settings_list)
+        stub = (
             "{\"tool\": \"respond\", \"args\": {\"message\": "
             "\"Provider stubbed in development mode\"}}"
         )
+        return iter([stub]) if stream else stub
+
+    def complete_turn(self, prompt, context=None):
+        """Return the completion of ``prompt`` and the provider context to continue from.
+
+        ``context`` is the value returned for the previous turn of the same
+        conversation. Ollama then evaluates only the new prompt on top of it
+        instead of prefilling the whole conversation again. Other providers
+        return a None context.
+        """
+        self.ensure_one()
+        if self.provider != "ollama":
+            return self.complete_text(prompt), None
+        settings = self._request_settings()
+        # Context token ids are only meaningful to the model that produced them.
+        settings_list = [settings] + [
+            peer for peer in self._peer_settings("completion") if peer["model_name"] == settings["model_name"]
+        ]
+        with timing.span("complete"):
+            data = self._ollama_generate(prompt, settings_list, context)
+        if data is None:
+            return UNAVAILABLE_COMPLETION, None
+        return data.get("response", ""), data.get("context")
+
+    def complete_texts(self, prompts):
+        """Return an iterator over the completions of ``prompts``, in order.
+
+        Up to ``completion_concurrency`` requests run at once. Like the
+        streaming mode of ``complete_text`` the iterator only uses the
+        network, so it can be consumed after the request cursor is closed.
+        """
+        self.ensure_one()
+        prompts = list(prompts)
+        if self.provider != "ollama" or not prompts:
+            return iter([self.complete_text(prompt) for prompt in prompts])
+        workers = max(1, min(self.completion_concurrency or 1, len(prompts)))
+        settings_list = [self._request_settings()] + self._peer_settings("completion")
+        return self._complete_concurrently(settings_list, prompts, workers)
+
+    def _complete_concurrently(self, settings_list, prompts, workers):
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="askodoo-complete")
+        futures = []
+        try:
+            futures.extend(pool.submit(self._ollama_completion, prompt, settings_list) for prompt in prompts)
+            for future in futures:
+                yield future.result()
+        finally:
+            # A consumer that stops early must not wait for the remaining prompts;
+            # they are cancelled one by one, as shutdown(cancel_futures=True) needs Python 3.9.
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
 
-    def _ollama_embedding(self, text):
-        response = requests.post(
-            f"{self.base_url}/api/embeddings",
-            json={"model": self.embedding_model, "prompt": text},
-            timeout=20,
+    def _request_settings(self):
+        """Snapshot the fields needed by provider requests.
+
+        The embedding helpers below run in worker threads and must only use
+        this dictionary, never the ORM.
+        """
+        self.ensure_one()
+        base_url = (self.base_url or "").rstrip("/")
+        keep_alive = (self.keep_alive or "").strip()
+        return {
+            "key": self._backend_key(),
+            "provider": self.provider,
+            "base_url": base_url,
+            "api_key": self.api_key,
+            "model_name": self.model_name,
+            "embedding_model": self.embedding_model,
+            "max_retries": max(0, self.max_retries),
+            "retry_backoff": self.retry_backoff,
+            "timeout": (self.connect_timeout, self.read_timeout),
+            "pool_size": self.pool_size,
+            "breaker_threshold": self.breaker_threshold,
+            "breaker_cooldown": self.breaker_cooldown,
+            # Ollama reads a bare number as seconds and anything else as a duration.
+            "keep_alive": int(keep_alive) if keep_alive.lstrip("-").isdigit() else keep_alive,
+        }
+
+    @api.model
+    def _embed_batch(self, settings_list, texts):
+        """Return the embeddings of ``texts``, or None when every backend failed."""
+        try:
+            return self._with_failover(
+                settings_list,
+                lambda settings: self._with_retries(settings, self._provider_embed_batch, settings, texts),
+            )
+        except ProviderError as error:
+            _logger.warning("AskOdoo embedding batch of %s texts failed, using fallback: %s", len(texts), error)
+            return None
+
+    @api.model
+    def _with_failover(self, settings_list, func):
+        """Call ``func(settings)`` on each backend in turn until one succeeds."""
+        error = ProviderError("No backend available")
+        for settings in settings_list:
+            try:
+                return func(settings)
+            except (requests.RequestException, ProviderError) as backend_error:
+                error = backend_error
+                if len(settings_list) > 1:
+                    _logger.info("AskOdoo backend %s failed, trying the next one: %s", settings["base_url"], error)
+        raise error
+
+    @api.model
+    def _with_retries(self, settings, func, *args):
+        attempts = settings["max_retries"] + 1
+        for attempt in range(attempts):
+            try:
+                return func(*args)
+            except (requests.RequestException, ProviderError) as error:
+                retryable = not isinstance(error, ProviderError) or error.retryable
+                if attempt + 1 >= attempts or not retryable:
+                    raise ProviderError(str(error), getattr(error, "status", None)) from error
+                time.sleep(settings["retry_backoff"] * (2 ** attempt))
+        raise ProviderError("No attempt made")
+
+    @api.model
+    def _provider_embed_batch(self, settings, texts):
+        provider = settings["provider"]
+        if provider == "ollama":
+            return self._ollama_embed_batch(settings, texts)
+        if provider == "openai":
+            return self._openai_embed_batch(settings, texts)
+        return self._gemini_embed_batch(settings, texts)
+
+    @api.model
+    def _post_json(self, settings, url, payload, headers=None):
+        """POST through the pooled session, failing fast while the circuit is open."""
+        breaker = http_pool.get_breaker(
+            settings["key"], settings["breaker_threshold"], settings["breaker_cooldown"]
+        )
+        if not breaker.allow():
+            raise ProviderError(f"Circuit open for {settings['base_url']}")
+        session = http_pool.get_session(settings["key"], settings["pool_size"])
+        try:
+            with http_pool.get_stats(settings["key"]).track():
+                response = session.post(url, json=payload, timeout=settings["timeout"], headers=headers)
+        except requests.RequestException:
+            breaker.record_failure()
+            raise
+        retryable = response.status_code == 429 or response.status_code >= 500
+        if retryable:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if not response.ok:
+            raise ProviderError(
+                f"{url} returned HTTP {response.status_code}",
+                status=response.status_code,
+                retryable=retryable,
+            )
+        return response.json()
+
+    @api.model
+    def _ollama_embed_batch(self, settings, texts):
+        try:
+            data = self._post_json(
+                settings,
+                f"{settings['base_url']}/api/embed",
+                {"model": settings["embedding_model"], "input": texts},
+            )
+        except ProviderError as error:
+            if error.status != 404:
+                raise
+            # Ollama releases before /api/embed only embed one prompt per call.
+            return [
+                self._post_json(
+                    settings,
+                    f"{settings['base_url']}/api/embeddings",
+                    {"model": settings["embedding_model"], "prompt": text},
+                ).get("embedding", [])
+                for text in texts
+            ]
+        return self._check_batch(data.get("embeddings"), texts)
+
+    @api.model
+    def _openai_embed_batch(self, settings, texts):
+        data = self._post_json(
+            settings,
+            f"{settings['base_url']}/v1/embeddings",
+            {"model": settings["embedding_model"], "input": texts},
+            headers={"Authorization": f"Bearer {settings['api_key']}"},
         )
-        if response.ok:
-            return response.json().get("embedding", [])
-        return self._deterministic_fallback_embedding(text)
-
-    def _ollama_completion(self, prompt):
-        response = requests.post(
-            f"{self.base_url}/api/generate",
-            json={"model": self.model_name, "prompt": prompt, "stream": False},
-            timeout=60,
+        items = sorted(data.get("data", []), key=lambda item: item.get("index", 0))
+        return self._check_batch([item.get("embedding") for item in items], texts)
+
+    @api.model
+    def _gemini_embed_batch(self, settings, texts):
+        model = f"models/{settings['embedding_model']}"
+        data = self._post_json(
+            settings,
+            f"{settings['base_url']}/v1beta/{model}:batchEmbedContents",
+            {"requests": [{"model": model, "content": {"parts": [{"text": text}]}} for text in texts]},
+            headers={"x-goog-api-key": settings["api_key"]},
         )
-        if response.ok:
-            return response.json().get("response", "")
-        return "{\"tool\": \"respond\", \"args\": {\"message\": \"No LLM response available\"}}"
+        return self._check_batch([item.get("values") for item in data.get("embeddings", [])], texts)
+
+    @api.model
+    def _check_batch(self, vectors, texts):
+        if not vectors or len(vectors) != len(texts) or not all(vectors):
+            raise ProviderError(f"Expected {len(texts)} embeddings, got {len(vectors or [])}", retryable=True)
+        return vectors
+
+    def _ollama_completion(self, prompt, settings_list=None):
+        data = self._ollama_generate(prompt, settings_list or [self._request_settings()])
+        return UNAVAILABLE_COMPLETION if data is None else data.get("response", "")
+
+    @api.model
+    def _ollama_generate(self, prompt, settings_list, context=None):
+        """Return the ``/api/generate`` answer of the first backend that succeeds, or None."""
+        try:
+            return self._with_failover(
+                settings_list,
+                lambda settings: self._post_json(
+                    settings,
+                    f"{settings['base_url']}/api/generate",
+                    self._generate_payload(settings, prompt, context=context),
+                ),
+            )
+        except (requests.RequestException, ProviderError) as error:
+            _logger.warning("AskOdoo completion failed: %s", error)
+            return None
+
+    @api.model
+    def _generate_payload(self, settings, prompt, stream=False, context=None):
+        payload = {"model": settings["model_name"], "prompt": prompt, "stream": stream}
+        if settings["keep_alive"] != "":
+            payload["keep_alive"] = settings["keep_alive"]
+        if context:
+            payload["context"] = context
+        return payload
+
+    @api.model
+    def _ollama_stream_completion(self, settings, prompt):
+        """Yield response fragments from Ollama's streaming ``/api/generate``."""
+        breaker = http_pool.get_breaker(
+            settings["key"], settings["breaker_threshold"], settings["breaker_cooldown"]
+        )
+        if not breaker.allow():
+            yield UNAVAILABLE_COMPLETION
+            return
+        session = http_pool.get_session(settings["key"], settings["pool_size"])
+        try:
+            with http_pool.get_stats(settings["key"]).track():
+                response = session.post(
+                    f"{settings['base_url']}/api/generate",
+                    json=self._generate_payload(settings, prompt, stream=True),
+                    timeout=settings["timeout"],
+                    stream=True,
+                )
+        except requests.RequestException as error:
+            breaker.record_failure()
+            _logger.warning("AskOdoo streaming completion failed: %s", error)
+            yield UNAVAILABLE_COMPLETION
+            return
+        with response:
+            if not response.ok:
+                if response.status_code == 429 or response.status_code >= 500:
+                    breaker.record_failure()
+                _logger.warning("AskOdoo streaming completion returned HTTP %s", response.status_code)
+                yield UNAVAILABLE_COMPLETION
+                return
+            breaker.record_success()
+            try:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        break
+            except requests.RequestException as error:
+                breaker.record_failure()
+                _logger.warning("AskOdoo streaming completion interrupted: %s", error)
 
     @api.model
     def _deterministic_fallback_embedding(self, text, dimensions=64):
@@ -0,0 +1,281 @@
+"""Per-request stage timings and latency histograms merged across workers.
+
+``collect()`` activates a ``Timings`` for the current context; ``span()``
+adds to it and is a no-op when none is active, so instrumented code costs
+almost nothing while timing is disabled. Finished collections feed the
+histograms rendered by ``render_prometheus()``.
+
+Each process keeps its own histograms and counters and publishes them, at
+most every ``PUBLISH_INTERVAL`` seconds, to a file named after its pid in
+``metrics_directory()``. Rendering merges the files of every worker of the
+host, so a scrape answered by any prefork worker sees all of them. Files
+left by exited workers are folded into ``archive.json`` so that counters
+never go backwards.
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PUBLISH_INTERVAL = 1.0
+ARCHIVE_FILE = "archive.json"
+
+_current = contextvars.ContextVar("askodoo_timings", default=None)
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_published = {"at": 0.0, "pid": None}
+
+
+class Timings:
+    """Milliseconds spent per stage, summed when a stage runs several times."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, stage, elapsed_ms):
+        self.stages[stage] = self.stages.get(stage, 0.0) + elapsed_ms
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000.0
+
+    def as_dict(self):
+        result = {stage: round(elapsed, 3) for stage, elapsed in self.stages.items()}
+        result["total"] = round(self.total_ms, 3)
+        return result
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def collect():
+    """Time the enclosed block and its spans, then record them in the histograms."""
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+        for stage, elapsed in timings.stages.items():
+            observe(stage, elapsed)
+        observe("total", timings.total_ms)
+        publish()
+
+
+@contextmanager
+def span(stage):
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(stage, (time.perf_counter() - started) * 1000.0)
+
+
+def observe(stage, elapsed_ms):
+    seconds = elapsed_ms / 1000.0
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][index] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+
+
+def count(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+    publish()
+
+
+def reset():
+    """Forget this process's metrics, including its published file."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+    try:
+        os.unlink(_worker_path(os.getpid()))
+    except OSError:
+        pass
+
+
+def metrics_directory():
+    # Per host: a data directory shared between servers must not mix their pids.
+    return os.path.join(config["data_dir"], "askodoo_metrics", socket.gethostname())
+
+
+def _worker_path(pid):
+    return os.path.join(metrics_directory(), f"{pid}.json")
+
+
+def _snapshot():
+    with _lock:
+        return {
+            "histograms": {
+                stage: dict(histogram, buckets=list(histogram["buckets"]))
+                for stage, histogram in _histograms.items()
+            },
+            "counters": dict(_counters),
+        }
+
+
+def publish(force=False):
+    """Write this process's metrics to its file, at most every ``PUBLISH_INTERVAL`` seconds."""
+    now = time.monotonic()
+    if not force and now - _published["at"] < PUBLISH_INTERVAL:
+        return
+    _published["at"] = now
+    pid = os.getpid()
+    path = _worker_path(pid)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if _published["pid"] != pid:
+            # A file under our pid was left by an exited process that had it before.
+            with _locked_directory() as directory:
+                _archive(directory, [path])
+            _published["pid"] = pid
+        with open(f"{path}.tmp", "w") as handle:
+            json.dump(_snapshot(), handle)
+        os.replace(f"{path}.tmp", path)
+    except OSError as error:
+        _logger.warning("AskOdoo could not publish metrics to %s: %s", path, error)
+
+
+def _forget_parent_metrics():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+    _published.update(at=0.0, pid=None)
+
+
+atexit.register(publish, force=True)
+if hasattr(os, "register_at_fork"):
+    # Prefork workers must not report again what the master observed before forking.
+    os.register_at_fork(after_in_child=_forget_parent_metrics)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(total, snapshot):
+    for stage, histogram in snapshot.get("histograms", {}).items():
+        merged = total["histograms"].setdefault(
+            stage, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        )
+        merged["buckets"] = [a + b for a, b in zip(merged["buckets"], histogram["buckets"])]
+        merged["sum"] += histogram["sum"]
+        merged["count"] += histogram["count"]
+    for name, value in snapshot.get("counters", {}).items():
+        total["counters"][name] = total["counters"].get(name, 0) + value
+    return total
+
+
+@contextmanager
+def _locked_directory():
+    """Hold the lock serializing the readers and writers of the archive."""
+    directory = metrics_directory()
+    with open(os.path.join(directory, ".lock"), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield directory
+
+
+def _archive(directory, paths):
+    """Add the worker files at ``paths`` to the archive and remove them; the directory lock must be held."""
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    archive = _read(archive_path) or {"histograms": {}, "counters": {}}
+    archived = [path for path in paths if os.path.exists(path)]
+    for path in archived:
+        _merge(archive, _read(path) or {})
+        os.unlink(path)
+    if archived:
+        with open(f"{archive_path}.tmp", "w") as handle:
+            json.dump(archive, handle)
+        os.replace(f"{archive_path}.tmp", archive_path)
+    return archive
+
+
+def merged_metrics():
+    """Return the metrics of every worker of the host, folding those of exited workers into the archive."""
+    publish(force=True)
+    total = {"histograms": {}, "counters": {}}
+    try:
+        with _locked_directory() as directory:
+            exited = []
+            for name in os.listdir(directory):
+                stem, extension = os.path.splitext(name)
+                if extension != ".json" or not stem.isdigit():
+                    continue
+                path = os.path.join(directory, name)
+                if int(stem) != os.getpid() and not _alive(int(stem)):
+                    exited.append(path)
+                    continue
+                _merge(total, _read(path) or {})
+            return _merge(total, _archive(directory, exited))
+    except OSError as error:
+        _logger.warning("AskOdoo could not merge worker metrics, serving this worker's only: %s", error)
+        return _merge({"histograms": {}, "counters": {}}, _snapshot())
+
+
+def render_prometheus():
+    """Return the metrics of all workers of the host in the Prometheus text exposition format."""
+    metrics = merged_metrics()
+    lines = [
+        "# HELP askodoo_stage_duration_seconds Time spent per AskOdoo pipeline stage.",
+        "# TYPE askodoo_stage_duration_seconds histogram",
+    ]
+    for stage, histogram in sorted(metrics["histograms"].items()):
+        labels = f'stage="{stage}"'
+        for bound, bucket_count in zip(BUCKETS, histogram["buckets"]):
+            lines.append(f'askodoo_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {bucket_count}')
+        lines.append(f'askodoo_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+        lines.append(f"askodoo_stage_duration_seconds_sum{{{labels}}} {histogram['sum']}")
+        lines.append(f"askodoo_stage_duration_seconds_count{{{labels}}} {histogram['count']}")
+    for name, value in sorted(metrics["counters"].items()):
+        lines.append(f"# TYPE askodoo_{name}_total counter")
+        lines.append(f"askodoo_{name}_total {value}")
+    return "\n".join(lines) + "\n"
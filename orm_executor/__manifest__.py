@@ -4,6 +4,6 @@
     "summary": "Safe allowlisted ORM execution for AskOdoo tool calls.",
     "license": "LGPL-3",
     "depends": ["base", "schema_extract"],
-    "data": ["security/ir.model.access.csv", "data/execution_rules.xml"],
+    "data": ["security/ir.model.access.csv", "data/execution_rules.xml", "data/ir_cron.xml"],
     "installable": True,
 }
@@ -1 +1,2 @@
 from . import orm_executor
+from . import schema_model
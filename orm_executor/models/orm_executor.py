@@ -2,7 +2,39 @@
 
 from __future__ import annotations
 
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from psycopg2.extras import execute_values
+
 from odoo import api, fields, models
+from odoo.tools import split_every, str2bool
+from odoo.tools.sql import create_index
+
+_logger = logging.getLogger(__name__)
+
+CRUD_METHODS = frozenset({"create", "write", "unlink"})
+
+AllowlistIndex = namedtuple("AllowlistIndex", ["generation", "allowed", "denied"])
+
+# Per-database allowlist, rebuilt when askodoo.schema.generation moves.
+_allowlist_indexes = {}
+
+# Key of the transaction's log rows in ``cr.postcommit.data``.
+LOG_BUFFER_KEY = "askodoo.execution.log.buffer"
+LOG_COLUMNS = (
+    "user_id", "model_name", "method_name", "domain_json", "payload_json", "result_summary", "status",
+    "timings_json", "create_uid", "create_date", "write_uid", "write_date",
+)
+
+# Log rows of committed transactions waiting for a batched insert, per database.
+_log_buffers = {}
+_log_timers = {}
+_log_lock = threading.Lock()
 
 
 class AskOdooExecutionLog(models.Model):
@@ -18,6 +50,49 @@ class AskOdooExecutionLog(models.Model):
     payload_json = fields.Text()
     result_summary = fields.Text()
     status = fields.Selection([("ok", "OK"), ("denied", "Denied"), ("error", "Error")], default="ok")
+    timings_json = fields.Text(help="Milliseconds spent per pipeline stage of the query that made this call.")
+
+    def init(self):
+        # Audit queries filter by user, model or status over a time range.
+        for column in ("user_id", "model_name", "status"):
+            create_index(
+                self.env.cr,
+                f"{self._table}_{column}_create_date_index",
+                self._table,
+                [f'"{column}"', "create_date"],
+            )
+
+    @api.model
+    def _log_settings(self):
+        params = self.env["ir.config_parameter"].sudo()
+        return {
+            "max_field_size": int(params.get_param("askodoo.execution_log.max_field_size", 4000)),
+            "buffer_size": int(params.get_param("askodoo.execution_log.buffer_size", 100)),
+            "flush_interval": float(params.get_param("askodoo.execution_log.flush_interval", 5.0)),
+            "retention_days": int(params.get_param("askodoo.execution_log.retention_days", 90)),
+            "compact_days": int(params.get_param("askodoo.execution_log.compact_days", 30)),
+        }
+
+    @api.model
+    def _gc_execution_logs(self):
+        """Cron: drop payloads of old successful calls, then delete entries past retention."""
+        settings = self._log_settings()
+        self.env.cr.execute(
+            f"""
+            UPDATE {self._table}
+               SET domain_json = NULL, payload_json = NULL, result_summary = NULL
+             WHERE status = 'ok'
+               AND payload_json IS NOT NULL
+               AND create_date < (now() at time zone 'UTC') - interval '1 day' * %s
+            """,
+            (settings["compact_days"],),
+        )
+        compacted = self.env.cr.rowcount
+        self.env.cr.execute(
+            f"DELETE FROM {self._table} WHERE create_date < (now() at time zone 'UTC') - interval '1 day' * %s",
+            (settings["retention_days"],),
+        )
+        _logger.info("AskOdoo execution log GC: %s compacted, %s deleted", compacted, self.env.cr.rowcount)
 
 
 class AskOdooORMExecutor(models.AbstractModel):
@@ -27,52 +102,253 @@ class AskOdooORMExecutor(models.AbstractModel):
     _description = "AskOdoo ORM Executor"
 
     @api.model
-    def execute_tool_call(self, tool_payload):
+    def execute_tool_call(self, tool_payload, timings=None):
+        """Run an allowlisted ``orm_call`` payload and log it.
+
+        ``timings`` holds the milliseconds the calling pipeline spent per
+        stage; the time spent here is added as ``execute`` in the log.
+        """
         if tool_payload.get("tool") != "orm_call":
             return {"status": "ignored", "message": "Unsupported tool"}
+        started = time.perf_counter()
         args = tool_payload.get("args", {})
         model_name = args.get("model")
         method = args.get("method")
         domain = args.get("domain", [])
         values = args.get("values", {})
+
+        def log_call(result, status):
+            log_timings = None
+            if timings is not None:
+                log_timings = dict(timings, execute=round((time.perf_counter() - started) * 1000.0, 3))
+            self._log(model_name, method, domain, values, result, status=status, timings=log_timings)
+
         allowed = self._is_allowed(model_name, method)
         if not allowed:
-            self._log(model_name, method, domain, values, "NO_VALID_METHOD", status="denied")
+            log_call("NO_VALID_METHOD", "denied")
             return {"status": "denied", "result": "NO_VALID_METHOD"}
+        settings = self._execution_settings()
         model = self.env[model_name]
-        records = model.search(domain)
         try:
-            if method == "create":
-                result = model.create(values).ids
-            elif method == "write":
-                result = records.write(values)
-            elif method == "unlink":
-                result = records.unlink()
-            else:
-                result = getattr(records, method)()
-            self._log(model_name, method, domain, values, str(result), status="ok")
+            # A savepoint keeps a failing batch from leaving earlier batches applied.
+            with self.env.cr.savepoint():
+                if method == "create":
+                    if not settings["skip_create_search"]:
+                        model.search(domain)
+                    created = model.create(values)
+                    result = self._summarize_result(created.ids, [created.ids], settings)
+                else:
+                    if settings["max_records"]:
+                        count = model.search_count(domain)
+                        if count > settings["max_records"]:
+                            message = f"TOO_MANY_RECORDS: {count} > {settings['max_records']}"
+                            log_call(message, "denied")
+                            return {"status": "denied", "result": "TOO_MANY_RECORDS", "count": count}
+                    record_ids = model.search(domain).ids
+                    result = self._summarize_result(
+                        record_ids,
+                        self._run_in_batches(model, method, record_ids, values, settings["batch_size"]),
+                        settings,
+                    )
+            log_call(json.dumps(result, default=str), "ok")
             return {"status": "ok", "result": result}
         except Exception as error:  # pylint: disable=broad-except
-            self._log(model_name, method, domain, values, str(error), status="error")
+            log_call(str(error), "error")
             return {"status": "error", "result": str(error)}
 
+    @api.model
+    def _execution_settings(self):
+        params = self.env["ir.config_parameter"].sudo()
+        return {
+            "skip_create_search": str2bool(params.get_param("askodoo.executor.skip_create_search", "True")),
+            "max_records": int(params.get_param("askodoo.executor.max_records", 1000)),
+            "batch_size": int(params.get_param("askodoo.executor.batch_size", 200)),
+            "result_limit": int(params.get_param("askodoo.executor.result_limit", 20)),
+        }
+
+    @api.model
+    def _run_in_batches(self, model, method, record_ids, values, batch_size):
+        """Apply ``method`` to ``record_ids`` in batches, dropping the cache between them."""
+        results = []
+        for batch_ids in split_every(batch_size or len(record_ids) or 1, record_ids):
+            records = model.browse(batch_ids)
+            if method == "write":
+                results.append(records.write(values))
+            elif method == "unlink":
+                results.append(records.unlink())
+            else:
+                results.append(getattr(records, method)())
+            self.env.invalidate_all()
+        return results
+
+    @api.model
+    def _summarize_result(self, record_ids, batch_results, settings):
+        """Keep the first ``result_limit`` ids and batches, and items of each list-like batch result."""
+        limit = settings["result_limit"]
+        results = [self._summarize_batch_result(result, limit) for result in batch_results[:limit]]
+        return {
+            "count": len(record_ids),
+            "ids": list(record_ids[:limit]),
+            "batches": len(batch_results),
+            "results": [summary for summary, _truncated in results],
+            "truncated": (
+                len(record_ids) > limit
+                or len(batch_results) > limit
+                or any(truncated for _summary, truncated in results)
+            ),
+        }
+
+    @api.model
+    def _summarize_batch_result(self, result, limit):
+        """Return ``(summary, truncated)``; long lists and recordsets become their count and first items."""
+        if isinstance(result, models.BaseModel):
+            result = result.ids
+        if isinstance(result, (list, tuple)) and len(result) > limit:
+            return {"count": len(result), "items": list(result[:limit])}, True
+        return result, False
+
     @api.model
     def _is_allowed(self, model_name, method_name):
-        schema = self.env["askodoo.schema.model"].search([("model_name", "=", model_name)], limit=1)
-        if not schema:
+        index = self._get_allowlist_index()
+        methods = index.allowed.get(model_name)
+        if methods is None:
+            return False
+        denied = index.denied.get(model_name, frozenset())
+        if "*" in denied or method_name in denied:
             return False
-        if method_name in {"create", "write", "unlink"}:
-            return True
-        return bool(schema.method_ids.filtered(lambda m: m.name == method_name))
+        return method_name in CRUD_METHODS or method_name in methods
+
+    @api.model
+    def _get_allowlist_index(self):
+        """Return the ``(model, method)`` allowlist, rebuilding it after schema changes.
+
+        The generation parameter is bumped by schema extraction and deny
+        override changes, and its cached value is invalidated in every
+        worker by the registry cache signaling.
+        """
+        params = self.env["ir.config_parameter"].sudo()
+        generation = params.get_param("askodoo.schema.generation", "0")
+        index = _allowlist_indexes.get(self.env.cr.dbname)
+        if index is None or index.generation != generation:
+            index = self._build_allowlist_index(generation)
+            _allowlist_indexes[self.env.cr.dbname] = index
+        return index
+
+    @api.model
+    def _build_allowlist_index(self, generation):
+        self.env["askodoo.schema.model"].flush_model()
+        self.env["askodoo.schema.method"].flush_model()
+        self.env.cr.execute(
+            """
+            SELECT model.model_name, model.denied_methods, method.name
+              FROM askodoo_schema_model model
+         LEFT JOIN askodoo_schema_model_method_rel rel ON rel.schema_model_id = model.id
+         LEFT JOIN askodoo_schema_method method ON method.id = rel.method_id
+             WHERE model.active
+            """
+        )
+        allowed = {}
+        denied = {}
+        for model_name, denied_methods, method_name in self.env.cr.fetchall():
+            methods = allowed.setdefault(model_name, set())
+            if method_name:
+                methods.add(method_name)
+            if denied_methods and model_name not in denied:
+                denied[model_name] = frozenset(
+                    name.strip() for name in denied_methods.split(",") if name.strip()
+                )
+        return AllowlistIndex(
+            generation,
+            {model_name: frozenset(methods) for model_name, methods in allowed.items()},
+            denied,
+        )
 
     @api.model
-    def _log(self, model_name, method_name, domain, payload, result, status="ok"):
-        self.env["askodoo.execution.log"].sudo().create({
-            "user_id": self.env.user.id,
-            "model_name": model_name or "",
-            "method_name": method_name or "",
-            "domain_json": str(domain),
-            "payload_json": str(payload),
-            "result_summary": result,
-            "status": status,
-        })
+    def _log(self, model_name, method_name, domain, payload, result, status="ok", timings=None):
+        """Buffer an execution log entry until its transaction commits.
+
+        Committed entries join a per-worker buffer that is inserted in one
+        batch on a cursor of its own, once it holds ``buffer_size`` entries
+        or ``flush_interval`` seconds after its first one. Entries of a
+        rolled-back transaction are dropped, as with a direct create.
+        """
+        settings = self.env["askodoo.execution.log"]._log_settings()
+        limit = settings["max_field_size"]
+        postcommit = self.env.cr.postcommit
+        rows = postcommit.data.get(LOG_BUFFER_KEY)
+        if rows is None:
+            rows = postcommit.data[LOG_BUFFER_KEY] = []
+            postcommit.add(lambda: _queue_log_rows(self.pool, rows, settings))
+        now = fields.Datetime.now()
+        rows.append((
+            self.env.uid,
+            model_name or "",
+            method_name or "",
+            self._truncate(json.dumps(domain, default=str), limit),
+            self._truncate(json.dumps(payload, default=str), limit),
+            self._truncate(result, limit),
+            status,
+            json.dumps(timings) if timings else None,
+            self.env.uid,
+            now,
+            self.env.uid,
+            now,
+        ))
+
+    @api.model
+    def _flush_log_buffer(self):
+        """Insert the entries this worker buffered for the current database."""
+        return _flush_log_rows(self.pool)
+
+    @api.model
+    def _truncate(self, value, limit):
+        if not value or not limit or len(value) <= limit:
+            return value
+        return f"{value[:limit]}... [{len(value) - limit} more chars]"
+
+
+def _queue_log_rows(registry, rows, settings):
+    """Add the log rows of a committed transaction to the worker buffer of its database."""
+    with _log_lock:
+        buffer = _log_buffers.setdefault(registry.db_name, [])
+        buffer.extend(rows)
+        full = len(buffer) >= settings["buffer_size"]
+        if not full and registry.db_name not in _log_timers:
+            timer = threading.Timer(settings["flush_interval"], _flush_log_rows, (registry,))
+            timer.daemon = True
+            _log_timers[registry.db_name] = timer
+            timer.start()
+    if full:
+        _flush_log_rows(registry)
+
+
+def _flush_log_rows(registry):
+    """Insert the buffered log rows of ``registry``'s database in one statement; return their number."""
+    with _log_lock:
+        rows = _log_buffers.pop(registry.db_name, [])
+        timer = _log_timers.pop(registry.db_name, None)
+    if timer is not None:
+        timer.cancel()
+    if not rows:
+        return 0
+    try:
+        with registry.cursor() as cr:
+            execute_values(
+                cr._obj,
+                f"INSERT INTO askodoo_execution_log ({', '.join(LOG_COLUMNS)}) VALUES %s",
+                rows,
+            )
+    except Exception:  # pylint: disable=broad-except
+        _logger.exception("AskOdoo could not write %s execution log entries", len(rows))
+        return 0
+    return len(rows)
+
+
+@atexit.register
+def _flush_all_log_rows():
+    """Write what a recycled worker still buffers; every non-empty buffer has a pending timer."""
+    with _log_lock:
+        timers = list(_log_timers.values())
+    for timer in timers:
+        timer.cancel()
+        timer.function(*timer.args)
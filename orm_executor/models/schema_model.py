@@ -0,0 +1,26 @@
+"""Executor-specific overrides on extracted schema models."""
+
+from __future__ import annotations
+
+from odoo import api, fields, models
+
+
+class AskOdooSchemaModel(models.Model):
+    _inherit = "askodoo.schema.model"
+
+    denied_methods = fields.Char(
+        help="Comma-separated methods the executor refuses on this model; '*' denies every method.",
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        if any(vals.get("denied_methods") for vals in vals_list):
+            self._bump_schema_generation()
+        return records
+
+    def write(self, vals):
+        result = super().write(vals)
+        if "denied_methods" in vals:
+            self._bump_schema_generation()
+        return result
@@ -1,6 +1,6 @@
 {
     "name": "AskOdoo RAG Embedding",
-    "version": "16.0.1.0.0",
+    "version": "16.0.1.1.0",
     "summary": "pgvector-backed embedding store for AskOdoo.",
     "license": "LGPL-3",
     "depends": ["base", "schema_extract", "llm_connector"],
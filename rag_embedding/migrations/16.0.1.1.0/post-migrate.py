@@ -0,0 +1,10 @@
+"""Move JSON embeddings into the binary vector columns created by ``init``."""
+
+from odoo import SUPERUSER_ID, api
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env["askodoo.rag.document"].convert_vector_storage()
@@ -1 +1,2 @@
 from . import rag_document
+from . import embedding_job
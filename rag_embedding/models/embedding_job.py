@@ -0,0 +1,171 @@
+"""Sharded, resumable embedding build jobs."""
+
+from __future__ import annotations
+
+import json
+import logging
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+JOB_STATES = [("pending", "Pending"), ("running", "Running"), ("done", "Done"), ("failed", "Failed")]
+
+
+class AskOdooEmbeddingJob(models.Model):
+    """A schema embedding build split into shards that workers claim independently."""
+
+    _name = "askodoo.embedding.job"
+    _description = "AskOdoo Embedding Job"
+    _order = "id desc"
+
+    state = fields.Selection(JOB_STATES, default="pending", required=True)
+    worker_count = fields.Integer(default=1)
+    shard_ids = fields.One2many("askodoo.embedding.job.shard", "job_id")
+    shard_count = fields.Integer(compute="_compute_progress")
+    done_count = fields.Integer(compute="_compute_progress")
+    failed_count = fields.Integer(compute="_compute_progress")
+    started_at = fields.Datetime()
+    finished_at = fields.Datetime()
+    stats_json = fields.Text()
+
+    @api.depends("shard_ids.state")
+    def _compute_progress(self):
+        for job in self:
+            states = job.shard_ids.mapped("state")
+            job.shard_count = len(states)
+            job.done_count = states.count("done")
+            job.failed_count = states.count("failed")
+
+    @api.model
+    def create_build_job(self, shard_size=50, worker_count=1):
+        """Split every schema model into shards of ``shard_size`` and queue them."""
+        schemas = self.env["askodoo.schema.model"].search([], order="id")
+        shard_size = max(1, shard_size)
+        return self.create({
+            "worker_count": worker_count,
+            "shard_ids": [
+                (0, 0, {
+                    "sequence": index,
+                    "schema_model_ids": [(6, 0, schemas[start:start + shard_size].ids)],
+                })
+                for index, start in enumerate(range(0, len(schemas), shard_size))
+            ],
+        })
+
+    @api.model
+    def get_resumable_job(self):
+        """Return the latest job that did not finish, if any."""
+        return self.search([("state", "!=", "done")], limit=1)
+
+    def prepare_run(self):
+        """Requeue shards left running or failed by an interrupted run."""
+        self.ensure_one()
+        self.shard_ids.filtered(lambda shard: shard.state in ("running", "failed")).write({"state": "pending"})
+        self.write({"state": "running", "started_at": self.started_at or fields.Datetime.now()})
+        self.env["askodoo.rag.document"].init_pgvector()
+
+    def process_shards(self):
+        """Claim and embed pending shards until none are left, committing each one.
+
+        Safe to run concurrently from several processes: shards are claimed
+        with ``SKIP LOCKED`` so every shard is processed once.
+        """
+        self.ensure_one()
+        documents = self.env["askodoo.rag.document"]
+        connector = self.env["askodoo.llm.connector"].get_connector("embedding")
+        use_pgvector = documents._pgvector_ready()
+        processed = 0
+        while True:
+            shard = self._claim_shard()
+            if not shard:
+                return processed
+            try:
+                specs = documents._schema_document_specs(shard.schema_model_ids)
+                stats = documents._sync_documents(specs, connector, use_pgvector)
+                shard.write({"state": "done", "stats_json": json.dumps(stats), "finished_at": fields.Datetime.now()})
+                self.env.cr.commit()
+            except Exception as error:  # pylint: disable=broad-except
+                self.env.cr.rollback()
+                _logger.exception("AskOdoo embedding shard %s failed", shard.sequence)
+                shard.write({"state": "failed", "error": str(error), "attempts": shard.attempts + 1})
+                self.env.cr.commit()
+            processed += 1
+
+    def _claim_shard(self):
+        self.env.cr.execute(
+            """
+            UPDATE askodoo_embedding_job_shard
+               SET state = 'running', started_at = now() at time zone 'UTC'
+             WHERE id = (
+                SELECT id
+                  FROM askodoo_embedding_job_shard
+                 WHERE job_id = %s AND state = 'pending'
+              ORDER BY sequence
+                 LIMIT 1
+                   FOR UPDATE SKIP LOCKED
+             )
+         RETURNING id
+            """,
+            (self.id,),
+        )
+        row = self.env.cr.fetchone()
+        self.env.cr.commit()
+        shard = self.env["askodoo.embedding.job.shard"].browse(row[0] if row else [])
+        shard.invalidate_recordset()
+        return shard
+
+    def finalize(self):
+        """Embed whatever the shards missed, prune stale documents and publish the index.
+
+        Documents embedded by the shards are unchanged by then, so the full
+        incremental sync only hashes them. The shards leave
+        ``askodoo.rag.corpus_generation`` alone; it is bumped here once for
+        the whole job.
+        """
+        self.ensure_one()
+        self.invalidate_recordset()
+        if self.failed_count:
+            self.state = "failed"
+            return False
+        documents = self.env["askodoo.rag.document"]
+        stats = documents.build_schema_embeddings()
+        shard_stats = [json.loads(shard.stats_json or "{}") for shard in self.shard_ids]
+        if not (stats["created"] or stats["updated"] or stats["deleted"]) and any(
+            shard.get("created") or shard.get("updated") for shard in shard_stats
+        ):
+            documents._bump_corpus_generation()
+        self.write({"state": "done", "finished_at": fields.Datetime.now(), "stats_json": json.dumps(stats)})
+        return stats
+
+    def get_status(self):
+        self.ensure_one()
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "workers": self.worker_count,
+            "shards": self.shard_count,
+            "done": self.done_count,
+            "failed": self.failed_count,
+            "started_at": self.started_at and fields.Datetime.to_string(self.started_at),
+            "finished_at": self.finished_at and fields.Datetime.to_string(self.finished_at),
+            "stats": json.loads(self.stats_json or "{}"),
+        }
+
+
+class AskOdooEmbeddingJobShard(models.Model):
+    """A slice of schema models embedded and committed as a unit."""
+
+    _name = "askodoo.embedding.job.shard"
+    _description = "AskOdoo Embedding Job Shard"
+    _order = "sequence"
+
+    job_id = fields.Many2one("askodoo.embedding.job", required=True, ondelete="cascade", index=True)
+    sequence = fields.Integer(required=True)
+    state = fields.Selection(JOB_STATES, default="pending", required=True, index=True)
+    schema_model_ids = fields.Many2many("askodoo.schema.model")
+    attempts = fields.Integer(default=0)
+    error = fields.Text()
+    stats_json = fields.Text()
+    started_at = fields.Datetime()
+    finished_at = fields.Datetime()
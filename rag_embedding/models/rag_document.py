@@ -2,10 +2,36 @@
 
 from __future__ import annotations
 
+import hashlib
 import json
+import logging
 import math
+import re
+import time
+from collections import Counter
+
+import psycopg2
+from psycopg2.extras import execute_values
 
 from odoo import api, fields, models
+from odoo.tools import split_every, str2bool
+from odoo.tools.sql import column_exists, create_column
+
+from odoo.addons.llm_connector.models.llm_connector import FallbackVector
+
+from . import vector_index, vector_storage
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_VECTOR_DIMENSION = 768
+BASE_METHODS_REF = "odoo.models.BaseModel"
+DOCUMENT_SOURCE_TYPES = ("schema", "field", "method")
+# Indexed expression for lexical search: identifiers split on punctuation, English stemming.
+LEXICAL_DOCUMENT_EXPR = (
+    "to_tsvector('english', regexp_replace(coalesce(source_ref, '') || ' ' || content, '[^[:alnum:]]+', ' ', 'g'))"
+)
+# Reciprocal rank fusion constant, as in Cormack et al.
+RRF_K = 60
 
 
 class AskOdooRagDocument(models.Model):
@@ -16,86 +42,728 @@ class AskOdooRagDocument(models.Model):
 
     name = fields.Char(required=True)
     source_type = fields.Selection(
-        [("schema", "Schema"), ("method", "Method"), ("knowledge", "Knowledge")],
+        [("schema", "Schema"), ("field", "Field Group"), ("method", "Method"), ("knowledge", "Knowledge")],
         default="knowledge",
         required=True,
     )
     source_ref = fields.Char(index=True)
     content = fields.Text(required=True)
-    embedding_json = fields.Text(help="JSON encoded embedding vector.")
+    embedding_json = fields.Text(help="JSON encoded embedding vector, only used by the json storage mode.")
+    content_hash = fields.Char(
+        index=True,
+        help="SHA-256 of the embedding model and content, used to skip unchanged documents on rebuild.",
+    )
+
+    def init(self):
+        # Binary vector columns are read and written with SQL only, never through the ORM cache.
+        columns = (("vector_blob", "bytea"), ("vector_format", "varchar"), ("vector_scale", "float8"))
+        for name, column_type in columns:
+            if not column_exists(self.env.cr, self._table, name):
+                create_column(self.env.cr, self._table, name, column_type)
+        self.env.cr.execute(
+            f"CREATE INDEX IF NOT EXISTS askodoo_rag_document_lexical_idx ON {self._table} "
+            f"USING gin ({LEXICAL_DOCUMENT_EXPR})"
+        )
 
     def as_vector(self):
         self.ensure_one()
-        return json.loads(self.embedding_json or "[]")
+        return list(self._load_vectors(self.ids).get(self.id, []))
 
+    @api.model
+    def _get_vector_storage(self):
+        """Return ``float32``, ``int8`` or ``json``."""
+        params = self.env["ir.config_parameter"].sudo()
+        return params.get_param("askodoo.rag.vector_storage", "float32")
 
     @api.model
-    def init_pgvector(self):
-        """Initialize pgvector extension and storage table."""
-        self.env.cr.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    def _decode_vector_row(self, raw_json, blob, vector_format, scale):
+        if blob is not None:
+            return vector_storage.decode(blob, vector_format, scale)
+        return json.loads(raw_json or "[]")
+
+    @api.model
+    def _vector_rows(self, ids=None, source_types=None):
+        """Return ``(id, source_type, vector)`` for documents holding an embedding."""
+        self.flush_model(["embedding_json", "source_type"])
+        where = ["(vector_blob IS NOT NULL OR embedding_json IS NOT NULL)"]
+        params = []
+        if ids is not None:
+            if not ids:
+                return []
+            where.append("id IN %s")
+            params.append(tuple(ids))
+        if source_types:
+            where.append("source_type IN %s")
+            params.append(tuple(source_types))
+        self.env.cr.execute(
+            f"""
+            SELECT id, source_type, embedding_json, vector_blob, vector_format, vector_scale
+              FROM {self._table}
+             WHERE {" AND ".join(where)}
+            """,
+            params,
+        )
+        return [
+            (doc_id, source_type, self._decode_vector_row(raw_json, blob, vector_format, scale))
+            for doc_id, source_type, raw_json, blob, vector_format, scale in self.env.cr.fetchall()
+        ]
+
+    @api.model
+    def _load_vectors(self, ids):
+        return {doc_id: vector for doc_id, _source_type, vector in self._vector_rows(ids=ids)}
+
+    @api.model
+    def _write_vectors(self, vectors_by_id, mode=None):
+        """Store ``{document_id: vector}`` in the configured storage mode."""
+        if not vectors_by_id:
+            return
+        mode = mode or self._get_vector_storage()
+        self.flush_model(["embedding_json"])
+        if mode == "json":
+            rows = [
+                (doc_id, json.dumps(list(vector)), None, None, None) for doc_id, vector in vectors_by_id.items()
+            ]
+        else:
+            rows = []
+            for doc_id, vector in vectors_by_id.items():
+                blob, scale = vector_storage.encode(vector, mode)
+                rows.append((doc_id, None, psycopg2.Binary(blob), mode, scale))
+        execute_values(
+            self.env.cr._obj,
+            f"""
+            UPDATE {self._table} doc
+               SET embedding_json = data.raw_json,
+                   vector_blob = data.blob,
+                   vector_format = data.vector_format,
+                   vector_scale = data.scale
+              FROM (VALUES %s) AS data (id, raw_json, blob, vector_format, scale)
+             WHERE doc.id = data.id
+            """,
+            rows,
+            template="(%s, %s::text, %s::bytea, %s::varchar, %s::float8)",
+        )
+        self.invalidate_model(["embedding_json"])
+
+    @api.model
+    def convert_vector_storage(self, mode=None, batch_size=1000):
+        """Rewrite stored embeddings that are not in ``mode`` (default: the configured mode)."""
+        mode = mode or self._get_vector_storage()
+        if mode not in vector_storage.STORAGE_MODES:
+            raise ValueError(f"Unknown vector storage mode {mode!r}")
+        self.flush_model()
+        if mode == "json":
+            self.env.cr.execute(f"SELECT id FROM {self._table} WHERE vector_blob IS NOT NULL ORDER BY id")
+        else:
+            self.env.cr.execute(
+                f"""
+                SELECT id FROM {self._table}
+                 WHERE (vector_blob IS NOT NULL AND vector_format != %s)
+                    OR (vector_blob IS NULL AND embedding_json IS NOT NULL)
+              ORDER BY id
+                """,
+                (mode,),
+            )
+        ids = [row[0] for row in self.env.cr.fetchall()]
+        for batch_ids in split_every(batch_size, ids):
+            self._write_vectors(self._load_vectors(list(batch_ids)), mode=mode)
+        _logger.info("AskOdoo converted %s embeddings to %s storage", len(ids), mode)
+        return len(ids)
+
+    @api.model
+    def vector_storage_report(self, sample_size=500, query_count=50, top_k=10):
+        """Compare storage size and int8 recall against float32 on a sample of stored vectors.
+
+        Recall is the overlap of the ``top_k`` neighbours found with int8
+        vectors and with float32 vectors, for ``query_count`` sampled
+        documents used as queries. It needs numpy and is None without it.
+        """
+        self.flush_model()
         self.env.cr.execute(
+            f"""
+            SELECT coalesce(vector_format, CASE WHEN embedding_json IS NOT NULL THEN 'json' END),
+                   count(*),
+                   sum(coalesce(pg_column_size(vector_blob), 0) + coalesce(pg_column_size(embedding_json), 0))
+              FROM {self._table}
+          GROUP BY 1
+            """
+        )
+        stored = {
+            vector_format or "none": {"documents": count, "bytes": int(size or 0)}
+            for vector_format, count, size in self.env.cr.fetchall()
+        }
+        self.env.cr.execute(f"SELECT id FROM {self._table} ORDER BY random() LIMIT %s", (sample_size,))
+        sample_ids = [row[0] for row in self.env.cr.fetchall()]
+        vectors = [list(vector) for vector in self._load_vectors(sample_ids).values()]
+        if vectors:
+            dimension = Counter(len(vector) for vector in vectors).most_common(1)[0][0]
+            vectors = [vector for vector in vectors if len(vector) == dimension]
+        sizes = {
+            "json": [len(json.dumps(vector)) for vector in vectors],
+            "float32": [len(vector_storage.encode(vector, "float32")[0]) for vector in vectors],
+            "int8": [len(vector_storage.encode(vector, "int8")[0]) + 8 for vector in vectors],
+        }
+        return {
+            "configured_mode": self._get_vector_storage(),
+            "stored": stored,
+            "sample_size": len(vectors),
+            "bytes_per_vector": {
+                mode: (sum(values) / len(values) if values else 0) for mode, values in sizes.items()
+            },
+            f"int8_recall_at_{top_k}": self._int8_recall(vectors, query_count, top_k),
+        }
+
+    @api.model
+    def _int8_recall(self, vectors, query_count, top_k):
+        numpy = vector_index.numpy
+        if numpy is None or len(vectors) <= top_k:
+            return None
+        quantized = []
+        for vector in vectors:
+            blob, scale = vector_storage.encode(vector, "int8")
+            quantized.append(vector_storage.decode(blob, "int8", scale))
+        matrices = []
+        for rows in (vectors, quantized):
+            matrix = numpy.asarray(rows, dtype=numpy.float32)
+            norms = numpy.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrices.append(matrix / norms)
+        recalls = []
+        for row in range(min(query_count, len(vectors))):
+            neighbours = []
+            for matrix in matrices:
+                scores = matrix @ matrices[0][row]
+                scores[row] = -numpy.inf
+                neighbours.append(set(numpy.argpartition(-scores, top_k - 1)[:top_k].tolist()))
+            recalls.append(len(neighbours[0] & neighbours[1]) / top_k)
+        return sum(recalls) / len(recalls)
+
+    @api.model
+    def _get_vector_dimension(self):
+        params = self.env["ir.config_parameter"].sudo()
+        return int(params.get_param("askodoo.rag.vector_dimension", DEFAULT_VECTOR_DIMENSION))
+
+    @api.model
+    def _get_retrieval_mode(self):
+        """Return ``auto``, ``mmap``, ``pgvector`` or ``python``."""
+        params = self.env["ir.config_parameter"].sudo()
+        return params.get_param("askodoo.rag.retrieval_mode", "auto")
+
+    @api.model
+    def init_pgvector(self):
+        """Initialize pgvector extension, storage table and ANN index.
+
+        Returns False when the extension cannot be installed, in which case
+        retrieval falls back to in-Python scoring.
+        """
+        cr = self.env.cr
+        dimension = self._get_vector_dimension()
+        try:
+            with cr.savepoint():
+                cr.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        except psycopg2.Error as error:
+            _logger.warning("AskOdoo pgvector unavailable, using Python scoring: %s", error)
+            return False
+        current_dimension = self._get_pgvector_table_dimension()
+        if current_dimension and current_dimension != dimension:
+            _logger.info(
+                "AskOdoo vector dimension changed from %s to %s, recreating askodoo_rag_vector",
+                current_dimension,
+                dimension,
+            )
+            cr.execute("DROP TABLE askodoo_rag_vector")
+        cr.execute(
             """
             CREATE TABLE IF NOT EXISTS askodoo_rag_vector (
                 id SERIAL PRIMARY KEY,
                 document_id INTEGER UNIQUE REFERENCES askodoo_rag_document(id) ON DELETE CASCADE,
-                embedding vector(64)
+                embedding vector(%s)
             )
             """
+            % dimension
         )
+        self._init_pgvector_index()
+        return True
+
+    @api.model
+    def _get_pgvector_table_dimension(self):
+        self.env.cr.execute(
+            """
+            SELECT a.atttypmod
+              FROM pg_attribute a
+             WHERE a.attrelid = to_regclass('askodoo_rag_vector')
+               AND a.attname = 'embedding'
+            """
+        )
+        row = self.env.cr.fetchone()
+        return row[0] if row and row[0] > 0 else None
+
+    @api.model
+    def _init_pgvector_index(self):
+        """Create the ANN index, preferring HNSW and falling back to IVFFlat."""
+        params = self.env["ir.config_parameter"].sudo()
+        method = params.get_param("askodoo.rag.vector_index", "hnsw")
+        if method == "none":
+            return
+        statements = {
+            "hnsw": (
+                "CREATE INDEX IF NOT EXISTS askodoo_rag_vector_embedding_idx "
+                "ON askodoo_rag_vector USING hnsw (embedding vector_cosine_ops)"
+            ),
+            "ivfflat": (
+                "CREATE INDEX IF NOT EXISTS askodoo_rag_vector_embedding_idx "
+                "ON askodoo_rag_vector USING ivfflat (embedding vector_cosine_ops) "
+                "WITH (lists = %s)" % int(params.get_param("askodoo.rag.ivfflat_lists", 100))
+            ),
+        }
+        order = ["hnsw", "ivfflat"] if method == "hnsw" else ["ivfflat"]
+        for candidate in order:
+            try:
+                with self.env.cr.savepoint():
+                    self.env.cr.execute(statements[candidate])
+                return
+            except psycopg2.Error as error:
+                _logger.warning("AskOdoo could not create %s index: %s", candidate, error)
+
+    @api.model
+    def _pgvector_ready(self):
+        self.env.cr.execute(
+            """
+            SELECT 1
+              FROM pg_extension
+             WHERE extname = 'vector'
+               AND to_regclass('askodoo_rag_vector') IS NOT NULL
+            """
+        )
+        return bool(self.env.cr.fetchone())
+
+    @api.model
+    def _vector_literal(self, vector):
+        return "[" + ",".join(str(float(v)) for v in vector) + "]"
 
     @api.model
     def _store_pgvector(self, document_id, vector):
-        vector_literal = "[" + ",".join(str(float(v)) for v in vector[:64]) + "]"
+        dimension = self._get_vector_dimension()
+        if len(vector) != dimension:
+            _logger.warning(
+                "AskOdoo skipping pgvector storage for document %s: got %s dimensions, expected %s",
+                document_id,
+                len(vector),
+                dimension,
+            )
+            return
         self.env.cr.execute(
             """
             INSERT INTO askodoo_rag_vector (document_id, embedding)
             VALUES (%s, %s::vector)
             ON CONFLICT (document_id) DO UPDATE SET embedding = EXCLUDED.embedding
             """,
-            (document_id, vector_literal),
+            (document_id, self._vector_literal(vector)),
         )
 
     @api.model
     def build_schema_embeddings(self):
-        """Refresh embeddings using schema and method metadata."""
-        connector = self.env["askodoo.llm.connector"].get_default_connector()
-        self.init_pgvector()
-        self.search([("source_type", "in", ["schema", "method"])]).unlink()
-        for schema in self.env["askodoo.schema.model"].search([]):
-            schema_content = f"Model: {schema.model_name}\nDescription: {schema.description}\nFields: {schema.fields_json}"
-            schema_rec = self.create({
+        """Refresh embeddings using schema and method metadata.
+
+        Only documents whose content or embedding model changed are
+        re-embedded, and existing rows are updated in place, so retrieval
+        keeps serving the previous vectors until the rebuild commits.
+        ``askodoo.rag.corpus_generation`` moves once, with that transaction,
+        when any document changed. Large builds go through
+        ``askodoo.embedding.job``, whose shards commit separately.
+        """
+        connector = self.env["askodoo.llm.connector"].get_connector("embedding")
+        use_pgvector = self.init_pgvector()
+        schemas = self.env["askodoo.schema.model"].search([])
+        specs = self._schema_document_specs(schemas) + self._base_document_specs()
+        stats = self._sync_documents(specs, connector, use_pgvector)
+        stats["deleted"] = self._prune_documents({(s["source_type"], s["source_ref"]) for s in specs})
+        self._rebuild_vector_index()
+        if stats["created"] or stats["updated"] or stats["deleted"]:
+            self._bump_corpus_generation()
+        _logger.info("AskOdoo embeddings rebuilt: %s", stats)
+        return stats
+
+    @api.model
+    def _schema_document_specs(self, schemas):
+        """Describe each model as a short summary, field group chunks and one document per method."""
+        group_size = max(
+            1, int(self.env["ir.config_parameter"].sudo().get_param("askodoo.rag.fields_per_chunk", 25))
+        )
+        specs = []
+        for schema in schemas:
+            field_lines = self._field_lines(json.loads(schema.fields_json or "{}"))
+            groups = [field_lines[i:i + group_size] for i in range(0, len(field_lines), group_size)]
+            specs.append({
                 "name": schema.model_name,
                 "source_type": "schema",
                 "source_ref": schema.model_name,
-                "content": schema_content,
-                "embedding_json": json.dumps(connector.embed_text(schema_content)),
+                "content": (
+                    f"Model: {schema.model_name}\nDescription: {schema.description}\n"
+                    f"Fields: {len(field_lines)} in {len(groups)} groups"
+                ),
             })
-            self._store_pgvector(schema_rec.id, json.loads(schema_rec.embedding_json))
-            for method in schema.method_ids:
-                method_content = (
-                    f"Model: {schema.model_name}\nMethod: {method.name}{method.signature}\n"
-                    f"Doc: {method.docstring or ''}"
-                )
-                method_rec = self.create({
+            for index, lines in enumerate(groups):
+                specs.append({
+                    "name": f"{schema.model_name} fields {index + 1}/{len(groups)}",
+                    "source_type": "field",
+                    "source_ref": f"{schema.model_name}#fields{index}",
+                    "content": f"Model: {schema.model_name} ({schema.description})\nFields:\n" + "\n".join(lines),
+                })
+            for method in schema.own_method_ids:
+                specs.append({
                     "name": f"{schema.model_name}.{method.name}",
                     "source_type": "method",
                     "source_ref": f"{schema.model_name}.{method.name}",
-                    "content": method_content,
-                    "embedding_json": json.dumps(connector.embed_text(method_content)),
+                    "content": (
+                        f"Model: {schema.model_name}\nMethod: {method.name}{method.signature}\n"
+                        f"Doc: {method.docstring or ''}"
+                    ),
                 })
-                self._store_pgvector(method_rec.id, json.loads(method_rec.embedding_json))
+        return specs
+
+    @api.model
+    def _field_lines(self, field_map):
+        """Render field metadata as one compact line per field."""
+        lines = []
+        for name, meta in sorted(field_map.items()):
+            flags = [meta.get("type") or "unknown"]
+            if meta.get("relation"):
+                flags.append(meta["relation"])
+            if meta.get("required"):
+                flags.append("required")
+            if meta.get("readonly"):
+                flags.append("readonly")
+            lines.append(f"{name} ({', '.join(flags)}): {meta.get('string') or ''}")
+        return lines
+
+    @api.model
+    def _base_document_specs(self):
+        base_methods = self.env["askodoo.schema.method"].search([("is_base", "=", True)], order="name")
+        if not base_methods:
+            return []
+        return [{
+            "name": "Common ORM methods",
+            "source_type": "method",
+            "source_ref": BASE_METHODS_REF,
+            "content": self._base_methods_content(base_methods),
+        }]
+
+    @api.model
+    def _content_hash(self, connector, content):
+        key = f"{connector.provider}:{connector.embedding_model}\0{content}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    @api.model
+    def _sync_documents(self, specs, connector, use_pgvector):
+        """Create or update documents for ``specs``, embedding only changed content.
+
+        Changed documents are embedded through ``embed_texts`` in chunks of
+        ``askodoo.rag.build_chunk_size``. ``askodoo.rag.corpus_generation``
+        is left to the caller, since parallel shards would conflict on it.
+        Documents that only got a fallback embedding are stored without a
+        content hash, so the next build embeds them again.
+        """
+        if not specs:
+            return {"created": 0, "updated": 0, "unchanged": 0, "fallback": 0}
+        existing = {
+            (doc.source_type, doc.source_ref): doc
+            for doc in self.search([
+                ("source_type", "in", list({spec["source_type"] for spec in specs})),
+                ("source_ref", "in", list({spec["source_ref"] for spec in specs})),
+            ])
+        }
+        stored = set()
+        if use_pgvector and existing:
+            # The vector table is recreated when its dimension changes.
+            self.env.cr.execute(
+                "SELECT document_id FROM askodoo_rag_vector WHERE document_id IN %s",
+                (tuple(doc.id for doc in existing.values()),),
+            )
+            stored = {row[0] for row in self.env.cr.fetchall()}
+        stats = {"created": 0, "updated": 0, "unchanged": 0, "fallback": 0}
+        pending = []
+        restore_ids = []
+        for spec in specs:
+            content_hash = self._content_hash(connector, spec["content"])
+            doc = existing.get((spec["source_type"], spec["source_ref"]))
+            if doc and doc.content_hash == content_hash:
+                if use_pgvector and doc.id not in stored:
+                    restore_ids.append(doc.id)
+                stats["unchanged"] += 1
+                continue
+            pending.append((spec, content_hash, doc))
+        for doc_id, vector in self._load_vectors(restore_ids).items():
+            self._store_pgvector(doc_id, vector)
+        chunk_size = int(self.env["ir.config_parameter"].sudo().get_param("askodoo.rag.build_chunk_size", 256))
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            vectors = connector.embed_texts([spec["content"] for spec, _hash, _doc in chunk])
+            to_create = []
+            embedded = {}
+            for (spec, content_hash, doc), vector in zip(chunk, vectors):
+                if isinstance(vector, FallbackVector):
+                    values = dict(spec, content_hash=False)
+                    stats["fallback"] += 1
+                else:
+                    values = dict(spec, content_hash=content_hash)
+                if doc:
+                    doc.write(values)
+                    embedded[doc.id] = vector
+                    stats["updated"] += 1
+                else:
+                    to_create.append((values, vector))
+            for doc, (_values, vector) in zip(self.create([values for values, _vector in to_create]), to_create):
+                embedded[doc.id] = vector
+            self._write_vectors(embedded)
+            if use_pgvector:
+                for doc_id, vector in embedded.items():
+                    self._store_pgvector(doc_id, vector)
+            stats["created"] += len(to_create)
+        return stats
+
+    @api.model
+    def _prune_documents(self, keep_keys, source_types=DOCUMENT_SOURCE_TYPES):
+        """Delete schema, field group and method documents whose source no longer exists."""
+        stale = self.search([("source_type", "in", list(source_types))]).filtered(
+            lambda doc: (doc.source_type, doc.source_ref) not in keep_keys
+        )
+        count = len(stale)
+        if count:
+            stale.unlink()
+        return count
+
+    @api.model
+    def _bump_corpus_generation(self):
+        """Advance the counter that caches built on document contents are keyed on.
+
+        Unlike ``askodoo.rag.index_generation`` it moves whatever the
+        retrieval backend. It follows the clock in milliseconds so that a
+        value published by a rolled-back transaction is not reused.
+        """
+        params = self.env["ir.config_parameter"].sudo()
+        current = int(params.get_param("askodoo.rag.corpus_generation", 0))
+        generation = max(current + 1, int(time.time() * 1000))
+        params.set_param("askodoo.rag.corpus_generation", generation)
+        return generation
+
+    @api.model
+    def _base_methods_content(self, methods):
+        """Describe the ORM methods every model inherits in a single document."""
+        lines = ["Common methods available on every model:"]
+        for method in methods:
+            summary = (method.docstring or "").strip().split("\n", 1)[0]
+            lines.append(f"Method: {method.name}{method.signature}" + (f" - {summary}" if summary else ""))
+        return "\n".join(lines)
+
+    @api.model
+    def _get_index_generation(self):
+        params = self.env["ir.config_parameter"].sudo()
+        return int(params.get_param("askodoo.rag.index_generation", 0))
+
+    @api.model
+    def _rebuild_vector_index(self):
+        """Write a new memory-mapped index generation and publish it.
+
+        The generation number only becomes visible to other workers when the
+        current transaction commits, so they keep using the previous files
+        until then.
+        """
+        if not vector_index.available():
+            return False
+        rows = [row for row in self._vector_rows() if len(row[2])]
+        if rows:
+            # Fallback embeddings may differ in size; index the dominant one.
+            dimension = Counter(len(row[2]) for row in rows).most_common(1)[0][0]
+            rows = [row for row in rows if len(row[2]) == dimension]
+        generation = self._get_index_generation() + 1
+        vector_index.write_index(
+            self.env.cr.dbname,
+            generation,
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+        )
+        self.env["ir.config_parameter"].sudo().set_param("askodoo.rag.index_generation", generation)
+        return generation
+
+    @api.model
+    def semantic_search(self, query, top_k=5, source_types=None, query_vector=None, dense=None):
+        """Return the ``top_k`` documents closest to ``query``.
+
+        When ``askodoo.rag.hybrid`` is on, a full-text prefilter over
+        ``source_ref`` and ``content`` first collects documents naming the
+        query terms; they are re-ranked by vector similarity and fused with
+        the dense ranking by reciprocal rank fusion. ``query_vector`` skips
+        embedding ``query`` when the caller already has it, and ``dense`` the
+        vector search when the caller already ranked the documents.
+        """
+        if query_vector is None:
+            connector = self.env["askodoo.llm.connector"].get_connector("embedding")
+            query_vector = connector.embed_text(query)
+        settings = self._hybrid_settings()
+        lexical_ids = []
+        if settings["enabled"]:
+            lexical_ids = self._lexical_search(query, settings["candidates"], source_types)
+        if not lexical_ids:
+            return dense if dense is not None else self._dense_search(query_vector, top_k, source_types)
+        vectors = self._load_vectors(lexical_ids)
+        reranked = sorted(
+            lexical_ids, key=lambda doc_id: -self._cosine_similarity(query_vector, vectors.get(doc_id, []))
+        )
+        # Each list counts once: the lexical candidates only through their vector re-ranking.
+        rankings = [reranked]
+        # A specific query yields enough candidates; only scan everything when it does not.
+        if dense is None:
+            dense = self._dense_search(query_vector, top_k, source_types, allow_scan=len(lexical_ids) < top_k)
+        if dense is not None:
+            rankings.append(dense.ids)
+        return self.browse(self._rrf_fuse(rankings, top_k))
+
+    @api.model
+    def semantic_search_batch(self, queries, query_vectors, top_k=5, source_types=None):
+        """Return one ``semantic_search`` result per query, ranking all of them at once.
+
+        The dense rankings come from a single matrix product against the
+        memory-mapped index, or against the stored vectors when scoring
+        happens in Python and numpy is available. pgvector is queried per
+        query, as its ANN index has no batch form.
+        """
+        index = self._batch_dense_index(query_vectors)
+        dense = [None] * len(queries)
+        if index is not None:
+            hit_lists = index.search_many(query_vectors, top_k, source_types)
+            # Documents deleted since the index was written; one query for the whole batch.
+            existing = set(self.browse({doc_id for hits in hit_lists for doc_id, _score in hits}).exists().ids)
+            dense = [self.browse([doc_id for doc_id, _score in hits if doc_id in existing]) for hits in hit_lists]
+        return [
+            self.semantic_search(query, top_k, source_types, query_vector=vector, dense=ranking)
+            for query, vector, ranking in zip(queries, query_vectors, dense)
+        ]
+
+    @api.model
+    def _batch_dense_index(self, query_vectors):
+        if not query_vectors or not vector_index.available():
+            return None
+        mode = self._get_retrieval_mode()
+        dimension = len(query_vectors[0])
+        if any(len(vector) != dimension for vector in query_vectors):
+            return None
+        if mode in ("auto", "mmap"):
+            index = vector_index.load_index(self.env.cr.dbname, self._get_index_generation())
+            if index is not None and index.dimension == dimension:
+                return index
+        if mode in ("auto", "pgvector") and dimension == self._get_vector_dimension() and self._pgvector_ready():
+            return None
+        rows = [row for row in self._vector_rows() if len(row[2]) == dimension]
+        if not rows:
+            return None
+        ids, source_types, vectors = zip(*rows)
+        return vector_index.build_index(ids, source_types, vectors)
+
+    @api.model
+    def _hybrid_settings(self):
+        params = self.env["ir.config_parameter"].sudo()
+        return {
+            "enabled": str2bool(params.get_param("askodoo.rag.hybrid", "True")),
+            "candidates": int(params.get_param("askodoo.rag.lexical_candidates", 50)),
+        }
+
+    @api.model
+    def _lexical_terms(self, query):
+        terms = (term.lower() for term in re.findall(r"[A-Za-z0-9]+", query or ""))
+        return list(dict.fromkeys(term for term in terms if len(term) > 1))
+
+    @api.model
+    def _lexical_search(self, query, limit, source_types=None):
+        """Return ids of documents matching any term of ``query``, best full-text rank first."""
+        terms = self._lexical_terms(query)
+        if not terms or not limit:
+            return []
+        where = ""
+        params = [" | ".join(terms)]
+        if source_types:
+            where = "AND source_type IN %s"
+            params.append(tuple(source_types))
+        params.append(limit)
+        self.flush_model(["source_ref", "content"])
+        self.env.cr.execute(
+            f"""
+            SELECT id
+              FROM {self._table}, to_tsquery('english', %s) query
+             WHERE {LEXICAL_DOCUMENT_EXPR} @@ query
+                   {where}
+          ORDER BY ts_rank_cd({LEXICAL_DOCUMENT_EXPR}, query) DESC, id
+             LIMIT %s
+            """,
+            params,
+        )
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _rrf_fuse(self, rankings, top_k):
+        scores = Counter()
+        for ranking in rankings:
+            for rank, doc_id in enumerate(ranking):
+                scores[doc_id] += 1.0 / (RRF_K + rank + 1)
+        return [doc_id for doc_id, _score in sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]]
+
+    @api.model
+    def _dense_search(self, query_vector, top_k, source_types=None, allow_scan=True):
+        """Vector-only search: the memory-mapped index, then pgvector, then in-Python scoring.
+
+        Returns None instead of scanning every document in Python when
+        ``allow_scan`` is false.
+        """
+        mode = self._get_retrieval_mode()
+        if mode in ("auto", "mmap"):
+            index = vector_index.load_index(self.env.cr.dbname, self._get_index_generation())
+            if index is not None and index.dimension == len(query_vector):
+                return self._mmap_search(index, query_vector, top_k, source_types)
+        if (
+            mode in ("auto", "pgvector")
+            and len(query_vector) == self._get_vector_dimension()
+            and self._pgvector_ready()
+        ):
+            return self._pgvector_search(query_vector, top_k, source_types)
+        if not allow_scan:
+            return None
+        if mode in ("mmap", "pgvector"):
+            _logger.warning("AskOdoo %s retrieval unavailable, using Python scoring", mode)
+        return self._python_search(query_vector, top_k, source_types)
+
+    @api.model
+    def _mmap_search(self, index, query_vector, top_k, source_types=None):
+        hits = index.search(query_vector, top_k, source_types)
+        return self.browse([doc_id for doc_id, _score in hits]).exists()
+
+    @api.model
+    def _pgvector_search(self, query_vector, top_k, source_types=None):
+        where = ""
+        params = [self._vector_literal(query_vector), top_k]
+        if source_types:
+            where = "WHERE d.source_type IN %s"
+            params.insert(0, tuple(source_types))
+        self.env.cr.execute(
+            f"""
+            SELECT v.document_id
+              FROM askodoo_rag_vector v
+              JOIN askodoo_rag_document d ON d.id = v.document_id
+              {where}
+          ORDER BY v.embedding <=> %s::vector
+             LIMIT %s
+            """,
+            params,
+        )
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
 
     @api.model
-    def semantic_search(self, query, top_k=5):
-        """Naive in-Python cosine scoring for portability; replace with pgvector SQL in production."""
-        connector = self.env["askodoo.llm.connector"].get_default_connector()
-        query_vector = connector.embed_text(query)
+    def _python_search(self, query_vector, top_k, source_types=None):
+        """Naive in-Python cosine scoring, kept as the portable fallback."""
         scored = []
-        for doc in self.search([]):
-            score = self._cosine_similarity(query_vector, doc.as_vector())
-            scored.append((score, doc))
+        for doc_id, _source_type, vector in self._vector_rows(source_types=source_types):
+            scored.append((self._cosine_similarity(query_vector, vector), doc_id))
         scored.sort(key=lambda x: x[0], reverse=True)
-        return [doc for _, doc in scored[:top_k]]
+        return self.browse([doc_id for _, doc_id in scored[:top_k]])
 
     @api.model
     def _cosine_similarity(self, vector_a, vector_b):
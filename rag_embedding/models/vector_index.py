@@ -0,0 +1,148 @@
+"""Memory-mapped float32 vector index shared by Odoo worker processes.
+
+Each build writes a generation directory holding a row-normalized float32
+matrix, the matching document ids and source types as ``.npy`` files. The
+directory is renamed into place atomically, and every worker maps the same
+files read-only, so the corpus lives once in the page cache.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import threading
+
+from odoo.tools import config
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - numpy is optional
+    numpy = None
+
+_logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def available():
+    return numpy is not None
+
+
+def index_directory(dbname):
+    return os.path.join(config["data_dir"], "askodoo_index", dbname)
+
+
+class VectorIndex:
+    """Read-only view over one generation of the index."""
+
+    def __init__(self, generation, ids, source_types, matrix):
+        self.generation = generation
+        self.ids = ids
+        self.source_types = source_types
+        self.matrix = matrix
+
+    @property
+    def dimension(self):
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query_vector, top_k, source_types=None):
+        """Return ``(document_id, score)`` pairs, best first."""
+        return self.search_many([query_vector], top_k, source_types)[0]
+
+    def search_many(self, query_vectors, top_k, source_types=None):
+        """Score every query against the index in one matrix product.
+
+        Returns one list of ``(document_id, score)`` pairs per query, best
+        first; queries of another dimension or with a null norm get no hits.
+        """
+        results = [[] for _query in query_vectors]
+        rows = [index for index, vector in enumerate(query_vectors) if len(vector) == self.dimension]
+        if not len(self) or not top_k or not rows:
+            return results
+        queries = numpy.asarray([query_vectors[index] for index in rows], dtype=numpy.float32)
+        norms = numpy.linalg.norm(queries, axis=1)
+        scores = (queries / numpy.where(norms == 0, 1.0, norms)[:, None]) @ self.matrix.T
+        if source_types:
+            scores = numpy.where(numpy.isin(self.source_types, list(source_types)), scores, -numpy.inf)
+        k = min(top_k, scores.shape[1])
+        for index, row, norm in zip(rows, scores, norms):
+            if not norm:
+                continue
+            top = numpy.argpartition(-row, k - 1)[:k]
+            top = top[numpy.argsort(-row[top])]
+            results[index] = [(int(self.ids[i]), float(row[i])) for i in top if numpy.isfinite(row[i])]
+        return results
+
+
+def normalized_matrix(vectors, rows):
+    if not rows:
+        # An empty corpus has no dimension to infer from.
+        return numpy.zeros((0, 0), dtype=numpy.float32)
+    matrix = numpy.asarray(vectors, dtype=numpy.float32).reshape(rows, -1)
+    norms = numpy.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def build_index(ids, source_types, vectors):
+    """Return an in-memory index over ``vectors``, for one-off batch scoring."""
+    return VectorIndex(
+        0,
+        numpy.asarray(ids, dtype=numpy.int64),
+        numpy.asarray(source_types, dtype="U16"),
+        normalized_matrix(vectors, len(ids)),
+    )
+
+
+def write_index(dbname, generation, ids, source_types, vectors):
+    """Write ``generation`` to disk and atomically move it into place."""
+    root = index_directory(dbname)
+    os.makedirs(root, exist_ok=True)
+    target = os.path.join(root, str(generation))
+    staging = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    numpy.save(os.path.join(staging, "vectors.npy"), normalized_matrix(vectors, len(ids)))
+    numpy.save(os.path.join(staging, "ids.npy"), numpy.asarray(ids, dtype=numpy.int64))
+    numpy.save(os.path.join(staging, "source_types.npy"), numpy.asarray(source_types, dtype="U16"))
+    # A directory for this generation can only be left over by a build whose
+    # transaction rolled back, so it was never published and is safe to drop.
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    _prune_generations(root, keep={str(generation), str(generation - 1)})
+    _logger.info("AskOdoo vector index generation %s written with %s rows", generation, len(ids))
+
+
+def _prune_generations(root, keep):
+    # Workers still mapping an old generation keep their pages after unlink.
+    for entry in os.listdir(root):
+        if entry not in keep and "." not in entry:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+
+def load_index(dbname, generation):
+    """Return the mapped index for ``generation`` or None when it is missing."""
+    if not available() or not generation:
+        return None
+    with _lock:
+        index = _loaded.get(dbname)
+        if index is not None and index.generation == generation:
+            return index
+        path = os.path.join(index_directory(dbname), str(generation))
+        try:
+            index = VectorIndex(
+                generation,
+                numpy.load(os.path.join(path, "ids.npy"), mmap_mode="r"),
+                numpy.load(os.path.join(path, "source_types.npy"), mmap_mode="r"),
+                numpy.load(os.path.join(path, "vectors.npy"), mmap_mode="r"),
+            )
+        except (OSError, ValueError) as error:
+            _logger.warning("AskOdoo vector index generation %s unavailable: %s", generation, error)
+            return None
+        _loaded[dbname] = index
+        return index
@@ -0,0 +1,31 @@
+"""Binary encodings for document embeddings.
+
+``float32`` stores native-order 4-byte floats. ``int8`` scales each vector
+by its largest magnitude into signed bytes plus one float scale, a quarter
+of the size at a small recall cost. Decoding casts the buffer returned by
+psycopg2 without copying it.
+"""
+
+from __future__ import annotations
+
+import array
+
+STORAGE_MODES = ("json", "float32", "int8")
+
+
+def encode(vector, mode):
+    """Return ``(blob, scale)`` for ``vector`` in a binary ``mode``."""
+    if mode == "int8":
+        peak = max((abs(value) for value in vector), default=0.0)
+        scale = peak / 127.0 if peak else 1.0
+        quantized = (max(-127, min(127, round(value / scale))) for value in vector)
+        return array.array("b", quantized).tobytes(), scale
+    return array.array("f", vector).tobytes(), None
+
+
+def decode(blob, mode, scale=None):
+    """Return the vector held in ``blob``: a float view, or floats rebuilt from int8."""
+    view = memoryview(blob)
+    if mode == "int8":
+        return [value * scale for value in view.cast("b")]
+    return view.cast("f")
@@ -1,6 +1,6 @@
 {
     "name": "AskOdoo Schema Extract",
-    "version": "16.0.1.0.0",
+    "version": "16.0.1.1.0",
     "summary": "Extract Odoo model schemas and callable methods for grounding.",
     "license": "LGPL-3",
     "depends": ["base"],
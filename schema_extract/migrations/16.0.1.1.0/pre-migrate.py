@@ -0,0 +1,12 @@
+"""Drop per-model method rows; they are re-extracted once per defining class."""
+
+from odoo.tools.sql import column_exists
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    cr.execute("DELETE FROM askodoo_schema_method")
+    cr.execute("ALTER TABLE askodoo_schema_method DROP COLUMN IF EXISTS schema_model_id")
+    if column_exists(cr, "askodoo_schema_model", "fingerprint"):
+        cr.execute("UPDATE askodoo_schema_model SET fingerprint = NULL")
@@ -1 +1,2 @@
 from . import schema_metadata
+from . import ir_module
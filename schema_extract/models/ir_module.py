@@ -0,0 +1,18 @@
+"""Queue schema extraction for modules installed or upgraded from the UI."""
+
+from __future__ import annotations
+
+from odoo import api, models
+
+
+class IrModuleModule(models.Model):
+    _inherit = "ir.module.module"
+
+    def _button_immediate_function(self, function):
+        module_names = self.mapped("name")
+        result = super()._button_immediate_function(function)
+        # The registry was rebuilt by super(); use an environment bound to it.
+        env = api.Environment(self._cr, self._uid, self._context)
+        if "askodoo.schema.model" in env:
+            env["askodoo.schema.model"]._queue_module_extraction(module_names)
+        return result
@@ -2,14 +2,22 @@
 
 from __future__ import annotations
 
+import hashlib
 import inspect
 import json
 import logging
+import time
+import weakref
 
 from odoo import api, fields, models
+from odoo.tools import str2bool
 
 _logger = logging.getLogger(__name__)
 
+# Signature and docstring per function object, shared by every model that
+# inherits the function.
+_introspection_cache = weakref.WeakKeyDictionary()
+
 
 class AskOdooSchemaModel(models.Model):
     """Stores extracted Odoo model and field metadata."""
@@ -22,40 +30,154 @@ class AskOdooSchemaModel(models.Model):
     transient = fields.Boolean(default=False)
     field_count = fields.Integer(default=0)
     fields_json = fields.Text(help="Serialized field metadata.")
-    method_ids = fields.One2many("askodoo.schema.method", "schema_model_id")
+    fingerprint = fields.Char(
+        readonly=True,
+        help="SHA-256 of the field metadata and method signatures at the last extraction.",
+    )
+    method_ids = fields.Many2many(
+        "askodoo.schema.method",
+        "askodoo_schema_model_method_rel",
+        "schema_model_id",
+        "method_id",
+        help="Methods callable on the model, including inherited ones.",
+    )
+    own_method_ids = fields.Many2many(
+        "askodoo.schema.method",
+        compute="_compute_own_method_ids",
+        help="Methods the model itself defines or overrides.",
+    )
     active = fields.Boolean(default=True)
 
     _sql_constraints = [
         ("askodoo_schema_model_unique", "unique(model_name)", "Model name must be unique."),
     ]
 
+    @api.depends("method_ids.owner_model", "model_name")
+    def _compute_own_method_ids(self):
+        for rec in self:
+            rec.own_method_ids = rec.method_ids.filtered(lambda m: m.owner_model == rec.model_name)
+
     @api.model
-    def extract_all_models(self):
-        """Extract all ORM models and persist metadata records."""
-        ir_models = self.env["ir.model"].sudo().search([])
-        created_or_updated = 0
+    def extract_all_models(self, model_names=None):
+        """Extract ORM models and persist metadata for the ones that changed.
+
+        Each model is fingerprinted from its field metadata and method
+        signatures; unchanged models are skipped and changed ones are
+        diffed instead of rewritten. When ``model_names`` is given only those
+        models are considered.
+        """
+        domain = [("model", "in", list(model_names))] if model_names is not None else []
+        ir_models = self.env["ir.model"].sudo().search(domain)
+        existing = {
+            rec.model_name: rec
+            for rec in self.with_context(active_test=False).search(
+                [("model_name", "in", ir_models.mapped("model"))]
+            )
+        }
+        method_index = self._load_method_index()
+        to_create = []
+        updated = self.browse()
         for ir_model in ir_models:
             model_name = ir_model.model
             model = self.env.get(model_name)
-            if not model:
+            if model is None:
                 continue
             field_map = self._extract_fields_metadata(model)
+            method_values = self._collect_methods_metadata(model)
             values = {
                 "model_name": model_name,
                 "description": ir_model.name,
                 "transient": bool(getattr(model, "_transient", False)),
                 "field_count": len(field_map),
-                "fields_json": json.dumps(field_map, default=str),
+                "fields_json": json.dumps(field_map, default=str, sort_keys=True),
+                "active": True,
             }
-            rec = self.search([("model_name", "=", model_name)], limit=1)
+            values["fingerprint"] = self._compute_fingerprint(values, method_values)
+            rec = existing.get(model_name)
+            if rec and rec.fingerprint == values["fingerprint"] and rec.active:
+                continue
             if rec:
                 rec.write(values)
+                rec._sync_methods_metadata(method_values, method_index)
+                updated |= rec
             else:
-                rec = self.create(values)
-            rec._extract_methods_metadata(model)
-            created_or_updated += 1
-        _logger.info("AskOdoo extracted %s models", created_or_updated)
-        return created_or_updated
+                to_create.append((values, method_values))
+        created = self.create([values for values, _methods in to_create])
+        for rec, (_values, method_values) in zip(created, to_create):
+            rec._sync_methods_metadata(method_values, method_index)
+        archived = self.browse()
+        if model_names is None:
+            archived = self.search([("model_name", "not in", ir_models.mapped("model"))])
+            archived.write({"active": False, "method_ids": [(5, 0, 0)]})
+            self.env["askodoo.schema.method"].search([("schema_model_ids", "=", False)]).unlink()
+        changed = len(created) + len(updated) + len(archived)
+        if changed:
+            self._bump_schema_generation()
+        _logger.info(
+            "AskOdoo extracted %s models (%s created, %s updated, %s archived, %s unchanged)",
+            len(ir_models),
+            len(created),
+            len(updated),
+            len(archived),
+            len(ir_models) - len(created) - len(updated),
+        )
+        return changed
+
+    @api.model
+    def extract_module_models(self, module_names):
+        """Extract only the models declared or extended by ``module_names``."""
+        data = self.env["ir.model.data"].sudo().search([
+            ("model", "=", "ir.model"),
+            ("module", "in", list(module_names)),
+        ])
+        ir_models = self.env["ir.model"].sudo().browse(data.mapped("res_id")).exists()
+        return self.extract_all_models(model_names=ir_models.mapped("model"))
+
+    @api.model
+    def _queue_module_extraction(self, module_names):
+        params = self.env["ir.config_parameter"].sudo()
+        if not str2bool(params.get_param("askodoo.schema.extract_on_module_change", "True")):
+            return
+        pending = set(filter(None, (params.get_param("askodoo.schema.pending_modules") or "").split(",")))
+        params.set_param("askodoo.schema.pending_modules", ",".join(sorted(pending | set(module_names))))
+        cron = self.env.ref("schema_extract.ir_cron_askodoo_schema_extract_modules", raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+
+    @api.model
+    def extract_pending_modules(self):
+        """Cron entry point extracting models of recently installed or upgraded modules."""
+        params = self.env["ir.config_parameter"].sudo()
+        pending = [name for name in (params.get_param("askodoo.schema.pending_modules") or "").split(",") if name]
+        if not pending:
+            return 0
+        params.set_param("askodoo.schema.pending_modules", "")
+        return self.extract_module_models(pending)
+
+    @api.model
+    def _bump_schema_generation(self):
+        """Advance the generation counter other workers use to drop caches.
+
+        The counter follows the clock in milliseconds so that a value
+        published by a rolled-back transaction is not reused by a later one.
+        """
+        params = self.env["ir.config_parameter"].sudo()
+        current = int(params.get_param("askodoo.schema.generation", 0))
+        generation = max(current + 1, int(time.time() * 1000))
+        params.set_param("askodoo.schema.generation", generation)
+        return generation
+
+    @api.model
+    def _compute_fingerprint(self, values, method_values):
+        payload = {
+            "description": values["description"],
+            "transient": values["transient"],
+            "fields": values["fields_json"],
+            "methods": sorted(
+                (m["owner_class"], m["name"], m["signature"], m["docstring"]) for m in method_values
+            ),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
 
     def _extract_fields_metadata(self, model):
         metadata = {}
@@ -70,30 +192,88 @@ class AskOdooSchemaModel(models.Model):
             }
         return metadata
 
-    def _extract_methods_metadata(self, model):
-        self.ensure_one()
-        self.method_ids.unlink()
-        method_records = []
-        for method_name in dir(model.__class__):
+    @api.model
+    def _collect_methods_metadata(self, model):
+        """Return public methods of ``model`` keyed by the class defining them."""
+        method_values = []
+        model_class = model.__class__
+        for method_name in dir(model_class):
             if method_name.startswith("_"):
                 continue
             if not self._is_supported_method_name(method_name):
                 continue
-            method = getattr(model.__class__, method_name, None)
-            if not callable(method):
+            owner, method = self._resolve_method_owner(model_class, method_name)
+            if owner is None or not callable(method):
                 continue
-            try:
-                signature = str(inspect.signature(method))
-            except (TypeError, ValueError):
-                signature = "(self, *args, **kwargs)"
-            method_records.append({
-                "schema_model_id": self.id,
+            signature, docstring = self._introspect_method(method)
+            owner_model = owner.__dict__.get("_name") or False
+            method_values.append({
+                "owner_class": f"{owner.__module__}.{owner.__qualname__}",
+                "owner_model": owner_model,
+                "is_base": not owner_model,
                 "name": method_name,
                 "signature": signature,
-                "docstring": inspect.getdoc(method) or "",
-                "is_public": True,
+                "docstring": docstring,
             })
-        self.env["askodoo.schema.method"].create(method_records)
+        return method_values
+
+    @api.model
+    def _resolve_method_owner(self, model_class, method_name):
+        for klass in model_class.__mro__:
+            if method_name in klass.__dict__:
+                method = klass.__dict__[method_name]
+                if isinstance(method, (classmethod, staticmethod)):
+                    method = method.__func__
+                return klass, method
+        return None, None
+
+    @api.model
+    def _introspect_method(self, method):
+        try:
+            return _introspection_cache[method]
+        except (KeyError, TypeError):
+            pass
+        try:
+            signature = str(inspect.signature(method))
+        except (TypeError, ValueError):
+            signature = "(self, *args, **kwargs)"
+        result = (signature, inspect.getdoc(method) or "")
+        try:
+            _introspection_cache[method] = result
+        except TypeError:
+            pass
+        return result
+
+    @api.model
+    def _load_method_index(self):
+        methods = self.env["askodoo.schema.method"].search([])
+        return {(method.owner_class, method.name): method for method in methods}
+
+    def _sync_methods_metadata(self, method_values, method_index=None):
+        """Link the model to shared method rows, creating or updating them as needed.
+
+        ``method_index`` maps ``(owner_class, name)`` to stored methods and is
+        updated in place so that later models reuse the rows created here.
+        """
+        self.ensure_one()
+        if method_index is None:
+            method_index = self._load_method_index()
+        Method = self.env["askodoo.schema.method"]
+        to_create = []
+        linked = Method
+        for values in method_values:
+            method = method_index.get((values["owner_class"], values["name"]))
+            if method is None:
+                to_create.append(dict(values, is_public=True))
+            else:
+                if (method.signature, method.docstring or "") != (values["signature"], values["docstring"]):
+                    method.write({"signature": values["signature"], "docstring": values["docstring"]})
+                linked |= method
+        for method in Method.create(to_create):
+            method_index[(method.owner_class, method.name)] = method
+            linked |= method
+        if set(linked.ids) != set(self.method_ids.ids):
+            self.method_ids = [(6, 0, linked.ids)]
 
     @api.model
     def _is_supported_method_name(self, method_name):
@@ -101,21 +281,29 @@ class AskOdooSchemaModel(models.Model):
 
 
 class AskOdooSchemaMethod(models.Model):
-    """Stores extracted callable metadata for model methods."""
+    """Stores extracted callable metadata once per defining class."""
 
     _name = "askodoo.schema.method"
     _description = "AskOdoo Schema Method"
 
-    schema_model_id = fields.Many2one("askodoo.schema.model", required=True, ondelete="cascade")
+    owner_class = fields.Char(required=True, index=True, help="Dotted path of the class defining the method.")
+    owner_model = fields.Char(index=True, help="Model the defining class belongs to; empty for ORM base classes.")
+    schema_model_ids = fields.Many2many(
+        "askodoo.schema.model",
+        "askodoo_schema_model_method_rel",
+        "method_id",
+        "schema_model_id",
+    )
     name = fields.Char(required=True, index=True)
     signature = fields.Char(required=True)
     docstring = fields.Text()
     is_public = fields.Boolean(default=True)
+    is_base = fields.Boolean(default=False, help="Inherited by every model from the ORM base classes.")
 
     _sql_constraints = [
         (
             "askodoo_schema_method_unique",
-            "unique(schema_model_id, name)",
-            "Each method name must be unique per model.",
+            "unique(owner_class, name)",
+            "Each method name must be unique per defining class.",
         ),
     ]